@@ -2,7 +2,9 @@
 from __future__ import annotations
 
 import os
-from functools import lru_cache
+from functools import cache, lru_cache
+
+import httpx
 
 from packages.shared.settings import settings, Settings
 from packages.clients.internal_api.client import InternalAPIClient
@@ -16,6 +18,7 @@ except Exception:
 
 __all__ = [
     "get_settings",
+    "get_http_transport",
     "get_internal_client",
     "get_s3_store",
     "get_s3",
@@ -53,6 +56,18 @@ def get_settings() -> Settings:
     return settings
 
 
+# ---------------- Shared HTTP transport ----------------
+@cache
+def get_http_transport() -> httpx.HTTPTransport:
+    """
+    One keep-alive connection pool shared by the internal-API client and the Ollama engine.
+    """
+    return httpx.HTTPTransport(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        retries=0,
+    )
+
+
 # ---------------- Internal API client ----------------
 @lru_cache(maxsize=1)
 def get_internal_client() -> InternalAPIClient:
@@ -66,40 +81,34 @@ def get_internal_client() -> InternalAPIClient:
         email=s.INTERNAL_API_USERNAME.get_secret_value(),
         password=s.INTERNAL_API_PASSWORD.get_secret_value(),
         timeout=s.INTERNAL_API_TIMEOUT_SEC,
+        transport=get_http_transport(),
     )
 
 
 # ---------------- S3 store (lazy singleton) ----------------
-_s3: S3Store | None = None
-
 def get_s3() -> S3Store:  # backward-compat alias
     return get_s3_store()
 
+@cache
 def get_s3_store() -> S3Store:
-    global _s3
-    if _s3 is None:
-        s = get_settings()
-        _s3 = S3Store(
-            endpoint=s.S3_ENDPOINT,
-            access_key=s.S3_ACCESS_KEY,
-            secret_key=s.S3_SECRET_KEY,
-            bucket=s.S3_BUCKET,
-            region=s.S3_REGION,
-        )
-        # Don’t fail import-time; just try to ensure the bucket exists.
-        try:
-            _s3.ensure_bucket(create_if_missing=True)
-        except Exception:
-            pass
-    return _s3
+    s = get_settings()
+    store = S3Store(
+        endpoint=s.S3_ENDPOINT,
+        access_key=s.S3_ACCESS_KEY,
+        secret_key=s.S3_SECRET_KEY,
+        bucket=s.S3_BUCKET,
+        region=s.S3_REGION,
+    )
+    # Don’t fail import-time; just try to ensure the bucket exists.
+    try:
+        store.ensure_bucket(create_if_missing=True)
+    except Exception:
+        pass
+    return store
 
 
 # ---------------- AV client (lazy singleton) ----------------
-_av: AVClient | None = None
-
+@cache
 def get_av() -> AVClient:
-    global _av
-    if _av is None:
-        s = get_settings()
-        _av = AVClient(host=s.CLAMAV_HOST, port=s.CLAMAV_PORT, required=s.AV_REQUIRED)
-    return _av
+    s = get_settings()
+    return AVClient(host=s.CLAMAV_HOST, port=s.CLAMAV_PORT, required=s.AV_REQUIRED)
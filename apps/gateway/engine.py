@@ -2,10 +2,18 @@
 from __future__ import annotations
 
 import os
+from functools import cache
 from typing import Any, Dict, Iterable, List, Optional
 
 import httpx
 
+try:
+    import orjson  # type: ignore
+    _loads = orjson.loads
+except Exception:  # pragma: no cover
+    import json
+    _loads = json.loads
+
 from packages.shared.settings import settings
 
 
@@ -33,14 +41,21 @@ class Engine:
     Minimal HTTP client for Ollama that works across SDK versions.
     """
 
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, transport: Optional[httpx.BaseTransport] = None):
         self.base_url = base_url.rstrip("/")
+        # one pooled client for all calls (keep-alive to Ollama); per-call timeouts below
+        self._client = httpx.Client(base_url=self.base_url, timeout=None, transport=transport)
+        self._owns_transport = transport is None
+
+    def close(self) -> None:
+        # a shared transport is closed by whoever owns it
+        if self._owns_transport:
+            self._client.close()
 
     def list_models(self) -> Dict[str, Any]:
-        with httpx.Client(timeout=30) as c:
-            r = c.get(f"{self.base_url}/api/tags")
-            r.raise_for_status()
-            return r.json()
+        r = self._client.get("/api/tags", timeout=30)
+        r.raise_for_status()
+        return r.json()
 
     def chat(
         self,
@@ -49,27 +64,32 @@ class Engine:
         stream: bool = False,
     ) -> Dict[str, Any] | Iterable[Dict[str, Any]]:
         payload = {"model": model, "messages": messages, "stream": bool(stream)}
-        with httpx.Client(timeout=None) as c:
-            if stream:
-                # generator of JSON lines
-                with c.stream("POST", f"{self.base_url}/api/chat", json=payload) as s:
-                    for line in s.iter_lines():
-                        if not line:
-                            continue
-                        yield httpx.Response(200, content=line).json()
-            else:
-                r = c.post(f"{self.base_url}/api/chat", json=payload)
-                r.raise_for_status()
-                return r.json()
-
-
-_engine_singleton: Optional[Engine] = None
+        if stream:
+            return self._chat_stream(payload)
+        r = self._client.post("/api/chat", json=payload)
+        r.raise_for_status()
+        return r.json()
+
+    def _chat_stream(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        # generator of JSON lines
+        with self._client.stream("POST", "/api/chat", json=payload) as s:
+            for line in s.iter_lines():
+                if not line:
+                    continue
+                yield _loads(line)
 
+
+@cache
 def get_engine() -> Engine:
     """
     Lazy singleton so callers can do: engine = Depends(get_engine)
     """
-    global _engine_singleton
-    if _engine_singleton is None:
-        _engine_singleton = Engine(base_url=_detect_ollama_base())
-    return _engine_singleton
+    from apps.gateway.deps import get_http_transport  # avoid import-time cycle
+    return Engine(base_url=_detect_ollama_base(), transport=get_http_transport())
+
+
+def close_engine() -> None:
+    """Release the pooled connections (app shutdown)."""
+    if get_engine.cache_info().currsize:
+        get_engine().close()
+        get_engine.cache_clear()
@@ -2,8 +2,30 @@
 from __future__ import annotations
 import os, json, time, typing as t
 import redis
+import redis.asyncio as aredis
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
 
 _redis = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"), decode_responses=True)
+# SSE readers block in XREAD; the asyncio client lets them wait without holding a thread or the loop
+_aredis = aredis.Redis.from_url(os.getenv("REDIS_URL", "redis://redis:6379/0"), decode_responses=True)
+
+# per-request event streams are trimmed to roughly this many entries
+EVENTS_MAXLEN = int(os.getenv("EVENTS_MAXLEN", "1000"))
+
+def _dumps(obj: t.Any) -> bytes | str:
+    # bytes go to redis as-is (decode_responses only affects replies), so no str round-trip
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)  # json.dumps accepts int keys too
+    return json.dumps(obj, ensure_ascii=False)
+
+def _loads(data: str | bytes) -> t.Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 def new_request(kind: str) -> str:
     import uuid
@@ -14,29 +36,34 @@ def new_request(kind: str) -> str:
 def set_state(rid: str, state: str, progress: float = 0.0, result: dict | None = None, error: str | None = None):
     payload = {"state": state, "progress": f"{progress:.3f}"}
     if result is not None:
-        payload["result"] = json.dumps(result, ensure_ascii=False)
+        payload["result"] = _dumps(result)
     if error:
         payload["error"] = error
-    _redis.hset(f"req:{rid}", mapping=payload)
     evt = {"ts": int(time.time()), "request_id": rid, "state": state, "progress": progress, "error": error}
-    _redis.xadd(f"events:{rid}", {"data": json.dumps(evt, ensure_ascii=False)})
+    # state + event in one round-trip
+    p = _redis.pipeline(transaction=False)
+    p.hset(f"req:{rid}", mapping=payload)
+    p.xadd(f"events:{rid}", {"data": _dumps(evt)}, maxlen=EVENTS_MAXLEN, approximate=True)
+    p.execute()
 
 def get_status(rid: str) -> dict:
     h = _redis.hgetall(f"req:{rid}") or {}
     if "result" in h:
-        h["result"] = json.loads(h["result"])
+        h["result"] = _loads(h["result"])
     if "progress" in h:
         try: h["progress"] = float(h["progress"])
         except Exception: h["progress"] = 0.0
     return h
 
 def enqueue(kind: str, rid: str, payload: dict):
-    _redis.lpush("jobs", json.dumps({"kind": kind, "request_id": rid, **(payload or {})}, ensure_ascii=False))
+    _redis.lpush("jobs", _dumps({"kind": kind, "request_id": rid, **(payload or {})}))
 
-def stream_events(rid: str, last_id: str = "$", block_ms: int = 15000):
+async def stream_events(rid: str, last_id: str = "$", block_ms: int = 15000, client: aredis.Redis | None = None):
+    """Async-yield event payloads (None after each idle `block_ms`, for keep-alives)."""
     key = f"events:{rid}"
+    xread = (client or _aredis).xread
     while True:
-        msgs = _redis.xread({key: last_id}, block=block_ms, count=10)
+        msgs = await xread({key: last_id}, block=block_ms, count=100)
         if not msgs:
             yield None
             continue
@@ -2,12 +2,16 @@
 from __future__ import annotations
 
 import os
+import re
 import shutil
 import time
-from typing import Dict, List
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 from starlette.responses import RedirectResponse, PlainTextResponse
 
 # Routers
@@ -20,14 +24,16 @@ from apps.gateway.schema import graphql_router                            # /gra
 # Security
 from packages.security.ip_allowlist import IPAllowlistMiddleware
 
-# simple in-memory request log for live API view
-_LOG_RING: List[str] = []
+try:
+    import orjson  # type: ignore  # noqa: F401
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
 
+# MemTotal / MemAvailable are the 1st and 3rd lines of /proc/meminfo (kernel >= 3.14)
+_MEMINFO_RE = re.compile(rb"MemTotal:\s+(\d+).*?MemAvailable:\s+(\d+)", re.S)
 
-def _log(line: str):
-    _LOG_RING.append(line)
-    if len(_LOG_RING) > 500:
-        del _LOG_RING[: len(_LOG_RING) - 500]
+# simple in-memory request log for live API view
+_LOG_RING: Deque[str] = deque(maxlen=500)
 
 
 def create_app() -> FastAPI:
@@ -38,7 +44,12 @@ def create_app() -> FastAPI:
     allowed_env = [x.strip() for x in ALLOW_STR.split(",") if x.strip()]
 
     # ---- app ----
-    app = FastAPI(title="Pruva Gateway", version=PRUVA_GATEWAY_VERSION)
+    # dict-returning endpoints serialize through orjson when it is installed
+    app = FastAPI(
+        title="Pruva Gateway",
+        version=PRUVA_GATEWAY_VERSION,
+        default_response_class=ORJSONResponse if orjson is not None else JSONResponse,
+    )
 
     # IP allow-list (localhost always allowed by the middleware implementation)
     # If you prefer to always enable it even when env is empty (localhost-only), leave as-is:
@@ -56,12 +67,21 @@ def create_app() -> FastAPI:
     # tiny middleware to record logs for Live API page
     @app.middleware("http")
     async def _mw_log(request: Request, call_next):
-        t0 = time.time()
+        t0 = time.perf_counter_ns()
         resp = await call_next(request)
-        dt = (time.time() - t0) * 1000
-        _log(f"{request.method} {request.url.path} {resp.status_code} {dt:.1f}ms")
+        dt = (time.perf_counter_ns() - t0) / 1e6
+        # deque.append is atomic; no lock/queue needed
+        _LOG_RING.append(f"{request.method} {request.url.path} {resp.status_code} {dt:.1f}ms")
         return resp
 
+    @app.on_event("shutdown")
+    def _close_http():
+        from apps.gateway.deps import get_http_transport
+        from apps.gateway.engine import close_engine
+        close_engine()
+        if get_http_transport.cache_info().currsize:
+            get_http_transport().close()
+
     # Root → UI
     @app.get("/", include_in_schema=False)
     def _root():
@@ -85,14 +105,10 @@ def create_app() -> FastAPI:
 
         mem_pct = None
         try:
-            if os.path.exists("/proc/meminfo"):
-                mi: Dict[str, str] = {}
-                with open("/proc/meminfo", "r") as f:
-                    for ln in f:
-                        k, _, v = ln.partition(":")
-                        mi[k.strip()] = v.strip()
-                total = float(mi.get("MemTotal", "0 kB").split()[0])
-                avail = float(mi.get("MemAvailable", "0 kB").split()[0])
+            with open("/proc/meminfo", "rb") as f:
+                m = _MEMINFO_RE.search(f.read(512))
+            if m:
+                total, avail = int(m.group(1)), int(m.group(2))
                 if total > 0:
                     mem_pct = round((1 - (avail / total)) * 100, 1)
         except Exception:
@@ -113,25 +129,18 @@ def create_app() -> FastAPI:
         }
 
     # Live API: routes + tail logs
+    # routes are static once create_app() returns; filled in at the end of it
+    routes_snapshot: Dict[str, object] = {"ok": True, "routes": []}
+
     @app.get("/api/routes")
     def api_routes():
-        rs = []
-        for r in app.routes:
-            try:
-                rs.append({
-                    "path": getattr(r, "path", getattr(r, "path_format", "")),
-                    "methods": list(getattr(r, "methods", []) or []),
-                    "name": getattr(r, "name", ""),
-                })
-            except Exception:
-                pass
-        return {"ok": True, "routes": rs}
+        return routes_snapshot
 
     @app.get("/api/logs")
     def api_logs(n: int = 200):
         if n <= 0:
             n = 1
-        return {"ok": True, "lines": _LOG_RING[-n:]}
+        return {"ok": True, "lines": list(islice(_LOG_RING, max(0, len(_LOG_RING) - n), None))}
     @app.get("/api/debug/ip")
     def debug_ip(request: Request):
         return {
@@ -162,6 +171,15 @@ def create_app() -> FastAPI:
             return PlainTextResponse("# prometheus-client not installed\n")
         return PlainTextResponse(generate_latest().decode("utf-8"))
 
+    routes_snapshot["routes"] = [
+        {
+            "path": getattr(r, "path", getattr(r, "path_format", "")),
+            "methods": list(getattr(r, "methods", []) or []),
+            "name": getattr(r, "name", ""),
+        }
+        for r in app.routes
+    ]
+
     return app
 
 
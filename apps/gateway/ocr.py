@@ -2,60 +2,199 @@ from __future__ import annotations
 
 import base64
 import io
+import math
+import os
+import queue
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Optional
+from functools import cache
+from typing import List, Optional, Tuple
 
 from PIL import Image
 from pdf2image import convert_from_bytes
 
+try:
+    import fitz  # type: ignore  # PyMuPDF
+except Exception:  # pragma: no cover
+    fitz = None  # type: ignore
+
+try:
+    import pybase64 as _b64  # type: ignore  # SIMD codec; the stdlib calls used here have the same signatures
+except Exception:  # pragma: no cover
+    _b64 = base64  # type: ignore
+
+try:
+    import tesserocr  # type: ignore  # in-process TessBaseAPI, no subprocess per page
+except Exception:  # pragma: no cover
+    tesserocr = None  # type: ignore
+
 try:
     import pytesseract  # type: ignore
 except Exception:  # pragma: no cover
     pytesseract = None  # type: ignore
 
+_HAVE_OCR = tesserocr is not None or pytesseract is not None
+_NO_OCR_NOTE = "pytesseract not installed"
+
+# pages OCR'd at once; with the pytesseract fallback each call runs its own tesseract process
+OCR_CONCURRENCY = max(1, int(os.getenv("OCR_CONCURRENCY", str(os.cpu_count() or 1))))
+
+# longest page edge (px) fed to tesseract and the preview encoder; receipts OCR fine at this size
+OCR_MAX_EDGE = int(os.getenv("OCR_MAX_EDGE", "1600"))
+
+# preview image format (JPEG/WEBP/PNG); it is only shown in the UI and sent to vision models
+PREVIEW_FMT = os.getenv("PREVIEW_FMT", "JPEG").upper()
+_PREVIEW_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
 
 @dataclass
 class OCRResult:
     text: str
-    image_png_base64: str
+    image_bytes: bytes  # encoded preview; base64 only at the JSON/LLM boundary
     page_count: int
     note: Optional[str] = None
     size: Optional[List[int]] = None
+    mime: str = "image/jpeg"
+
+    @property
+    def image_b64(self) -> str:
+        return _b64.b64encode(self.image_bytes).decode("ascii")
+
+    @property
+    def image_png_base64(self) -> str:
+        """Deprecated: use `image_b64` with `mime`. Despite the name this is PREVIEW_FMT
+        (JPEG by default), not necessarily PNG."""
+        warnings.warn(
+            "OCRResult.image_png_base64 is deprecated; use image_b64 and mime (the preview is "
+            "PREVIEW_FMT, JPEG by default)",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return self.image_b64
 
 
-def _png_b64(im: Image.Image) -> str:
+def _img_bytes(im: Image.Image, fmt: str = PREVIEW_FMT) -> bytes:
     buf = io.BytesIO()
-    im.save(buf, format="PNG")
-    return base64.b64encode(buf.getvalue()).decode("ascii")
+    if fmt == "PNG":
+        im.save(buf, format="PNG")
+    else:
+        im.save(buf, format=fmt, quality=85, optimize=False)
+    return buf.getvalue()
+
+
+@cache
+def _ocr_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=OCR_CONCURRENCY, thread_name_prefix="ocr")
+
+
+# warm tesserocr handles shared across requests; created on first use, at most OCR_POOL of them
+OCR_POOL = max(1, int(os.getenv("OCR_POOL", "4")))
+_api_pool: "queue.Queue" = queue.Queue()
+_api_made = 0
+_api_lock = threading.Lock()
+
+
+def _api_get():
+    global _api_made
+    try:
+        return _api_pool.get_nowait()
+    except queue.Empty:
+        pass
+    with _api_lock:
+        if _api_made < OCR_POOL:
+            _api_made += 1
+            try:
+                return tesserocr.PyTessBaseAPI()
+            except Exception:
+                _api_made -= 1
+                raise
+    return _api_pool.get()
+
+
+def _image_to_string(im: Image.Image) -> str:
+    if tesserocr is None:
+        return pytesseract.image_to_string(im) or ""
+    api = _api_get()
+    try:
+        api.SetImage(im)
+        return api.GetUTF8Text() or ""
+    finally:
+        _api_pool.put(api)
+
+
+def _ocr_pages(pages: List[Image.Image]) -> str:
+    # threads are enough: tesserocr releases the GIL and pytesseract waits on subprocesses
+    if len(pages) == 1 or OCR_CONCURRENCY == 1:
+        texts = [_image_to_string(p) for p in pages]
+    else:
+        texts = list(_ocr_pool().map(_image_to_string, pages))
+    return "\n".join([t for t in texts if t])
+
+
+def _shrink(im: Image.Image) -> Image.Image:
+    # in place, keeps aspect ratio; no-op when already small enough
+    im.thumbnail((OCR_MAX_EDGE, OCR_MAX_EDGE), Image.Resampling.LANCZOS)
+    return im
+
+
+def _render_pdf(raw: bytes, dpi: int = 200, max_pages: Optional[int] = None) -> Tuple[List[Image.Image], int]:
+    """(first `max_pages` PDF pages as RGB images, total page count).
+
+    PyMuPDF renders in-process; pdf2image (poppler) is the fallback.
+    """
+    if fitz is None:
+        if max_pages is None:
+            pages = [_shrink(p) for p in convert_from_bytes(raw, dpi=dpi)]  # type: ignore
+            return pages, len(pages)
+        from pdf2image import pdfinfo_from_bytes
+        count = int(pdfinfo_from_bytes(raw).get("Pages", 0))
+        pages = [_shrink(p) for p in convert_from_bytes(raw, dpi=dpi, first_page=1, last_page=max_pages)]  # type: ignore
+        return pages, count
+    pages: List[Image.Image] = []
+    with fitz.open(stream=raw, filetype="pdf") as doc:
+        for i, page in enumerate(doc):
+            if max_pages is not None and i >= max_pages:
+                break
+            # render close to OCR_MAX_EDGE instead of oversampling and scaling back down
+            edge_pt = max(page.rect.width, page.rect.height) or 1
+            page_dpi = min(dpi, math.ceil(OCR_MAX_EDGE * 72 / edge_pt))
+            pix = page.get_pixmap(matrix=fitz.Matrix(page_dpi / 72, page_dpi / 72), alpha=False)
+            pages.append(_shrink(Image.frombytes("RGB", (pix.width, pix.height), pix.samples)))
+        return pages, doc.page_count
 
 
 def do_ocr(raw: bytes, mime: Optional[str] = None) -> OCRResult:
     # PDF
     if mime == "application/pdf" or raw[:4] == b"%PDF":
-        pages = convert_from_bytes(raw, dpi=200)  # type: ignore
+        # without an OCR engine only the preview (first page) is ever looked at
+        pages, page_count = _render_pdf(raw, dpi=200, max_pages=None if _HAVE_OCR else 1)
         if not pages:
             raise ValueError("empty PDF") 
         text = ""
-        if pytesseract:
-            text = "\n".join((pytesseract.image_to_string(p) or "") for p in pages).strip()
+        if _HAVE_OCR:
+            text = _ocr_pages(pages).strip()
         first = pages[0].convert("RGB")
         return OCRResult(
             text=text,
-            image_png_base64=_png_b64(first),
-            page_count=len(pages),
-            note=None if pytesseract else "pytesseract not installed",
+            image_bytes=_img_bytes(first),
+            page_count=page_count,
+            note=None if _HAVE_OCR else _NO_OCR_NOTE,
             size=[first.width, first.height],
+            mime=_PREVIEW_MIME.get(PREVIEW_FMT, "image/jpeg"),
         )
 
     # Image
-    im = Image.open(io.BytesIO(raw)).convert("RGB")
+    im = _shrink(Image.open(io.BytesIO(raw)).convert("RGB"))
     text = ""
-    if pytesseract:
-        text = pytesseract.image_to_string(im) or ""
+    if _HAVE_OCR:
+        text = _image_to_string(im)
     return OCRResult(
         text=text.strip(),
-        image_png_base64=_png_b64(im),
+        image_bytes=_img_bytes(im),
         page_count=1,
-        note=None if pytesseract else "pytesseract not installed",
+        note=None if _HAVE_OCR else _NO_OCR_NOTE,
         size=[im.width, im.height],
+        mime=_PREVIEW_MIME.get(PREVIEW_FMT, "image/jpeg"),
     )
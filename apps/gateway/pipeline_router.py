@@ -3,17 +3,43 @@ from __future__ import annotations
 import base64
 import io
 import json
-from typing import Any, Dict
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
 
 from fastapi import APIRouter, Body, Depends, HTTPException
 from PIL import Image
+from starlette.concurrency import run_in_threadpool
 
 from apps.gateway.deps import get_engine, get_internal_client
-from apps.gateway.ocr import do_ocr, OCRResult
+from apps.gateway.ocr import PREVIEW_FMT, do_ocr, OCRResult
 from apps.gateway.schemas import ChatIn, ExtractIn
 
+try:
+    import pybase64 as _b64  # type: ignore
+except Exception:  # pragma: no cover
+    _b64 = base64  # type: ignore
+
 router = APIRouter(prefix="/api/llm", tags=["llm", "ai"])
 
+_JSON_DEC = json.JSONDecoder()
+
+
+def _first_json_object(s: str) -> Dict[str, Any]:
+    # first complete {...} in the model output; raw_decode stops at its closing brace,
+    # so prose or stray braces around it don't matter and nothing is sliced out
+    i = s.find("{")
+    while i != -1:
+        try:
+            data, _ = _JSON_DEC.raw_decode(s, i)
+            if isinstance(data, dict):
+                return data
+        except ValueError:
+            pass
+        i = s.find("{", i + 1)
+    return {}
+
 
 @router.get("/models")
 def list_models(engine=Depends(get_engine)) -> Dict[str, Any]:
@@ -33,8 +59,57 @@ def chat(body: ChatIn = Body(...), engine=Depends(get_engine)) -> Dict[str, Any]
         raise HTTPException(status_code=502, detail=f"Ollama chat failed: {e}")
 
 
+class _ByteLRU:
+    """LRU of raw file bytes bounded by total size, not entry count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._d: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            val = self._d.get(key)
+            if val is not None:
+                self._d.move_to_end(key)
+            return val
+
+    def put(self, key: Hashable, val: bytes) -> None:
+        if len(val) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._d.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._d[key] = val
+            self.size += len(val)
+            while self.size > self.max_bytes:
+                _, dropped = self._d.popitem(last=False)
+                self.size -= len(dropped)
+
+
+# fileHash identifies the content, so retries / GraphQL+REST repeats skip the internal fetch
+_FILE_CACHE = _ByteLRU(int(os.getenv("EXTRACT_FILE_CACHE_MB", "64")) << 20)
+
+
+def _prepare_image(raw: bytes) -> Tuple[bytes, str]:
+    """OCR one file (runs in the threadpool). Returns (image_bytes, ocr_excerpt)."""
+    try:
+        ocr: OCRResult = do_ocr(raw)
+        return ocr.image_bytes, (ocr.text or "")[:2000]
+    except Exception:
+        # OCR unavailable/failed: send the image itself; only re-encode formats the model can't take
+        im = Image.open(io.BytesIO(raw))
+        if im.format in ("JPEG", "PNG"):
+            return raw, ""
+        buf = io.BytesIO()
+        im.convert("RGB").save(buf, format=PREVIEW_FMT, quality=85)
+        return buf.getvalue(), ""
+
+
 @router.post("/extract")
-def vision_extract(
+async def vision_extract(
     body: ExtractIn = Body(...),
     engine=Depends(get_engine),
     internal=Depends(get_internal_client),
@@ -42,24 +117,29 @@ def vision_extract(
     if internal is None:
         raise HTTPException(status_code=424, detail="Internal API client not configured (set INTERNAL_API_BASE).")
 
-    try:
-        b64 = internal.expense_file_base64(
-            kod=body.ref.kod, file_id=body.ref.fileId, file_hash=body.ref.fileHash
-        )
-    except Exception as e:
-        raise HTTPException(status_code=424, detail=f"internal file fetch failed: {e}")
-    raw = base64.b64decode(b64, validate=False)
+    ref = body.ref
+    cache_key = (ref.kod, ref.fileId, ref.fileHash)
+    raw = _FILE_CACHE.get(cache_key) if ref.fileHash else None
+    if raw is None:
+        try:
+            b64 = await run_in_threadpool(
+                internal.expense_file_base64,
+                kod=ref.kod, file_id=ref.fileId, file_hash=ref.fileHash,
+            )
+        except Exception as e:
+            raise HTTPException(status_code=424, detail=f"internal file fetch failed: {e}")
+        try:
+            raw = await run_in_threadpool(_b64.b64decode, b64, validate=False)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"unreadable file: {e}")
+        if ref.fileHash:
+            _FILE_CACHE.put(cache_key, raw)
 
     try:
-        ocr: OCRResult = do_ocr(raw)
-        img_b64 = ocr.image_png_base64
-        ocr_excerpt = (ocr.text or "")[:2000]
-    except Exception:
-        im = Image.open(io.BytesIO(raw)).convert("RGB")
-        buf = io.BytesIO()
-        im.save(buf, format="PNG")
-        img_b64 = base64.b64encode(buf.getvalue()).decode("ascii")
-        ocr_excerpt = ""
+        # page-level parallelism is ocr._ocr_pool's job; tesserocr releases the GIL while it works
+        img_bytes, ocr_excerpt = await run_in_threadpool(_prepare_image, raw)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"unreadable file: {e}")
 
     system = (
         "You are an invoice/receipt extraction assistant. "
@@ -73,25 +153,14 @@ def vision_extract(
 
     messages = [
         {"role": "system", "content": system},
-        {"role": "user", "content": user, "images": [img_b64]},
+        {"role": "user", "content": user, "images": [_b64.b64encode(img_bytes).decode("ascii")]},
     ]
     try:
-        res = engine.chat(model=body.model, messages=messages, stream=False)  # type: ignore
+        res = await run_in_threadpool(engine.chat, model=body.model, messages=messages, stream=False)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Ollama vision chat failed: {e}")
 
     text = (res or {}).get("message", {}).get("content", "") or ""
 
-    data = {}
-    s = text.strip()
-    try:
-        if s.startswith("{") and s.endswith("}"):
-            data = json.loads(s)
-        else:
-            i, j = s.find("{"), s.rfind("}")
-            if i != -1 and j != -1:
-                data = json.loads(s[i : j + 1])
-    except Exception:
-        pass
-
+    data = _first_json_object(text)
     return {"ok": True, "model": body.model, "data": data or None, "raw": None if data else text}
@@ -1,9 +1,10 @@
 # apps/gateway/router_unified.py
 from __future__ import annotations
 from typing import List, Optional, Literal, Dict, Any
-import os, json, asyncio
+import os, json, shutil
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 from packages.security.jwt_dep import verify_service_jwt
 from apps.gateway.events_bus import new_request, enqueue, get_status, stream_events
@@ -23,7 +24,7 @@ except Exception:
 router = APIRouter(prefix="/api", tags=["unified"])
 
 # ---- Schemas (pydantic) kept simple to avoid import collisions ----
-from pydantic import BaseModel, HttpUrl, Field
+from pydantic import BaseModel, HttpUrl, Field, TypeAdapter
 
 RequestKind = Literal["chat","extract"]
 
@@ -47,21 +48,65 @@ class UnifiedRequestStatus(BaseModel):
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
+# built once; request_status is polled, so validate + dump straight to JSON bytes
+_UNIFIED_STATUS_TA = TypeAdapter(UnifiedRequestStatus)
+
 def _scan_or_pass(b: bytes):
     if _clam_scan:
         _clam_scan(b)  # raise on virus
     # else: no-op fallback (keeps current behavior)
 
+_LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "./storage")
+_RAW_DIR = os.path.join(_LOCAL_STORAGE_DIR, "raw")
+_MADE_DIRS: set = set()  # only the fixed parent (_RAW_DIR) once it is known to exist
+UPLOAD_CHUNK = 1 << 20
+
+def _local_path(obj_key: str) -> str:
+    d = os.path.join(_LOCAL_STORAGE_DIR, os.path.dirname(obj_key))
+    parent = os.path.dirname(d)
+    if parent in _MADE_DIRS:
+        # one mkdir instead of makedirs stat-walking the whole path
+        try:
+            os.mkdir(d)
+        except FileExistsError:
+            pass
+        except FileNotFoundError:  # parent removed since (e.g. dev storage wiped)
+            _MADE_DIRS.discard(parent)
+            os.makedirs(d, exist_ok=True)
+    else:
+        os.makedirs(d, exist_ok=True)
+        if parent == _RAW_DIR:
+            _MADE_DIRS.add(parent)
+    return os.path.join(_LOCAL_STORAGE_DIR, obj_key)
+
+def _safe_name(name: Optional[str]) -> str:
+    # client-supplied; keep the last path component so the key stays raw/<rid>/<name>
+    base = (name or "").replace("\\", "/").rsplit("/", 1)[-1]
+    return base if base not in ("", ".", "..") else "upload.bin"
+
 def _store_bytes(obj_key: str, data: bytes, mime: str):
+    # sync; callers run it in the threadpool
     if _put_bytes:
         _put_bytes(obj_key, data, mime)
     else:
         # fallback local FS under ./storage for dev
-        base = os.getenv("LOCAL_STORAGE_DIR", "./storage")
-        os.makedirs(os.path.join(base, os.path.dirname(obj_key)), exist_ok=True)
-        with open(os.path.join(base, obj_key), "wb") as f:
+        with open(_local_path(obj_key), "wb") as f:
             f.write(data)
 
+def _store_upload(obj_key: str, src, mime: str) -> int:
+    """Scan + store an upload from its spooled temp file; returns the size. Sync (threadpool)."""
+    src.seek(0)
+    if _clam_scan or _put_bytes:
+        # these helpers take the whole payload
+        data = src.read()
+        _scan_or_pass(data)
+        _store_bytes(obj_key, data, mime)
+        return len(data)
+    # local FS: copy in UPLOAD_CHUNK pieces, never holding the file in memory
+    with open(_local_path(obj_key), "wb") as out:
+        shutil.copyfileobj(src, out, UPLOAD_CHUNK)
+        return out.tell()
+
 @router.post("/requests", response_model=UnifiedRequestCreated)
 async def create_request(
     data: UnifiedRequestCreate = Depends(),
@@ -70,16 +115,15 @@ async def create_request(
 ):
     rid = new_request(data.kind)
 
-    file_bytes = None
+    size = 0
     file_name = None
+    key = None
     if files:
         f = files[0]
-        fb = await f.read()
-        _scan_or_pass(fb)  # ClamAV if available
-        file_name = f.filename or "upload.bin"
+        file_name = _safe_name(f.filename)
         key = f"raw/{rid}/{file_name}"
-        _store_bytes(key, fb, f.content_type or "application/octet-stream")
-        file_bytes = fb
+        # the upload is already spooled to a temp file; scan/store it off the event loop
+        size = await run_in_threadpool(_store_upload, key, f.file, f.content_type or "application/octet-stream")
 
     enqueue(data.kind, rid, {
         "message": data.message,
@@ -87,7 +131,8 @@ async def create_request(
         "doc_type": data.doc_type,
         "locale": data.locale,
         "metadata": data.metadata,
-        "file_bytes_present": bool(file_bytes),  # worker may choose to reload from storage
+        "file_bytes_present": bool(size),  # worker may choose to reload from storage
+        "object_key": key,  # where the upload was stored
     })
     # NOTE: we do not push `file_bytes` into Redis by default to keep memory low.
 
@@ -98,26 +143,25 @@ async def request_status(rid: str, _svc=Depends(verify_service_jwt)):
     s = get_status(rid)
     if not s:
         raise HTTPException(status_code=404, detail="not found")
-    return UnifiedRequestStatus(
-        request_id=rid,
-        kind=s.get("kind","extract"),
-        state=s.get("state","queued"),
-        progress=s.get("progress",0.0),
-        result=s.get("result"),
-        error=s.get("error")
-    )
+    st = _UNIFIED_STATUS_TA.validate_python({
+        "request_id": rid,
+        "kind": s.get("kind","extract"),
+        "state": s.get("state","queued"),
+        "progress": s.get("progress",0.0),
+        "result": s.get("result"),
+        "error": s.get("error"),
+    })
+    # response_model stays for the OpenAPI schema; returning a Response skips FastAPI's re-serialization
+    return Response(_UNIFIED_STATUS_TA.dump_json(st), media_type="application/json")
 
 @router.get("/requests/{rid}/events")
 async def request_events(rid: str, _svc=Depends(verify_service_jwt)):
     async def gen():
         yield "retry: 3000\n\n"
-        it = stream_events(rid)
-        while True:
-            data = next(it)
+        async for data in stream_events(rid):
             if data is None:
-                # keep-alive
+                # keep-alive after each idle 15s block
                 yield ": ping\n\n"
             else:
                 yield f"data: {data}\n\n"
-            await asyncio.sleep(0)
     return StreamingResponse(gen(), media_type="text/event-stream")
@@ -5,6 +5,11 @@ from typing import Any, Dict, List, Optional
 import strawberry
 from strawberry.fastapi import GraphQLRouter
 
+# resolved once at import; nothing here imports this module back, so there is no cycle
+from apps.gateway.deps import get_engine, get_internal_client
+from apps.gateway.pipeline_router import chat, list_models, vision_extract
+from apps.gateway.schemas import ChatIn, ChatMessage, ExtractIn, FileRef
+
 
 # ----------------------------- GraphQL types -------------------------------- #
 
@@ -73,29 +78,23 @@ class Query:
 
     @strawberry.field
     def llm_models(self) -> strawberry.scalars.JSON:
-        # Import lazily to avoid circulars
-        from apps.gateway.pipeline_router import list_models  # type: ignore
-        return list_models()
+        return list_models(engine=get_engine())
 
 
 @strawberry.type
 class Mutation:
     @strawberry.mutation
     def ai_chat(self, input: AIChatInput) -> AIChatPayload:
-        from apps.gateway.pipeline_router import ChatIn, ChatMessage, chat  # type: ignore
-
         body = ChatIn(
             model=input.model,
             messages=[ChatMessage(role=m.role, content=m.content) for m in input.messages],
             stream=bool(input.stream),
         )
-        out = chat(body)  # calls the REST handler function directly
+        out = chat(body, engine=get_engine())  # calls the REST handler function directly
         return AIChatPayload(ok=out["ok"], model=out["model"], message=out["message"])
 
     @strawberry.mutation
-    def ai_extract(self, input: ExtractInput) -> ExtractPayload:
-        from apps.gateway.pipeline_router import ExtractIn, FileRef, vision_extract  # type: ignore
-
+    async def ai_extract(self, input: ExtractInput) -> ExtractPayload:
         body = ExtractIn(
             ref=FileRef(kod=input.ref.kod, fileId=input.ref.fileId, fileHash=input.ref.fileHash),
             prompt=input.prompt,
@@ -103,7 +102,7 @@ class Mutation:
             run_ocr=bool(input.run_ocr),
             return_prompt=bool(input.return_prompt),
         )
-        out = vision_extract(body)  # uses FastAPI deps defaults internally
+        out = await vision_extract(body, engine=get_engine(), internal=get_internal_client())
 
         return ExtractPayload(
             ok=out["ok"],
@@ -1,36 +1,90 @@
 from __future__ import annotations
 
+import os
 import threading
 import uuid
-from typing import Dict, List, Optional
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Set
+
+from pydantic import TypeAdapter
 
 from apps.gateway.schemas import ChatSession, Turn
 
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
 try:
     import redis  # type: ignore
 except Exception:  # pragma: no cover
     redis = None  # type: ignore
 
 
+# opt-in cap on turns kept per session (LTRIM to the newest N); 0 keeps everything
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "0"))
+
+_TURNS = TypeAdapter(List[Turn])
+
+
+# Writes stay on model_dump_json (pydantic-core's native encoder beats orjson over
+# model_dump()); reads parse with orjson first, which is faster than validate_json.
+def _load_session(raw: str) -> ChatSession:
+    if orjson is not None:
+        return ChatSession.model_validate(orjson.loads(raw))
+    return ChatSession.model_validate_json(raw)
+
+
+def _load_turns(items: List[str]) -> List[Turn]:
+    arr = "[" + ",".join(items) + "]"  # one validator call for the whole list
+    if orjson is not None:
+        return _TURNS.validate_python(orjson.loads(arr))
+    return _TURNS.validate_json(arr)
+
+
 class _MemoryIndex:
     def __init__(self):
         self.lock = threading.Lock()
         self.data: Dict[str, str] = {}
-        self.order: List[str] = []
+        self.order: Deque[str] = deque()
+        self._seen: Set[str] = set()
+        self.lists: Dict[str, List[str]] = {}
 
     def set(self, key: str, val: str):
         with self.lock:
             self.data[key] = val
-            if key not in self.order:
+            if key not in self._seen:
+                self._seen.add(key)
                 self.order.append(key)
 
     def get(self, key: str) -> Optional[str]:
         with self.lock:
             return self.data.get(key)
 
+    def rpush(self, key: str, vals: List[str], maxlen: int = 0) -> None:
+        with self.lock:
+            items = self.lists.setdefault(key, [])
+            items.extend(vals)
+            if maxlen and len(items) > maxlen:
+                del items[: len(items) - maxlen]
+
+    def replace_list(self, key: str, vals: List[str]) -> None:
+        with self.lock:
+            self.lists[key] = list(vals)
+
+    def lrange(self, key: str) -> List[str]:
+        with self.lock:
+            return list(self.lists.get(key, ()))
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        with self.lock:
+            return [self.data.get(k) for k in keys]
+
     def list(self, limit: int) -> List[str]:
         with self.lock:
-            return list(reversed(self.order))[:limit]
+            # newest first, touching only `limit` entries
+            return list(islice(reversed(self.order), 0, max(0, limit)))
 
 
 class SessionStore:
@@ -48,21 +102,33 @@ class SessionStore:
     def _key(self, sid: str) -> str:
         return f"{self.ns}:{sid}"
 
-    def _save_raw(self, sid: str, raw: str) -> None:
+    def _turns_key(self, sid: str) -> str:
+        return f"{self.ns}:{sid}:turns"
+
+    # The main key holds the session header (turns excluded); turns live in a list
+    # so add_turn appends one item instead of rewriting the whole session.
+    # Older blobs with embedded turns still load and are migrated on the next write.
+
+    def _header(self, ss: ChatSession) -> str:
+        return ss.model_dump_json(exclude={"turns"})
+
+    def _save_header(self, ss: ChatSession, pipe=None) -> None:
         if self.r:
-            self.r.set(self._key(sid), raw)
-            try:
-                updated = ChatSession.model_validate_json(raw).updated_ts
-            except Exception:
-                updated = 0.0
-            self.r.zadd(f"{self.ns}:index", {sid: updated})
+            p = pipe if pipe is not None else self.r.pipeline()
+            p.set(self._key(ss.id), self._header(ss))
+            p.zadd(f"{self.ns}:index", {ss.id: ss.updated_ts})
+            if pipe is None:
+                p.execute()
         else:
-            self.mem.set(self._key(sid), raw)
+            self.mem.set(self._key(ss.id), self._header(ss))
 
-    def _load_raw(self, sid: str) -> Optional[str]:
-        if self.r:
-            return self.r.get(self._key(sid))
-        return self.mem.get(self._key(sid))
+    def _assemble(self, raw: Optional[str], turns: List[str]) -> Optional[ChatSession]:
+        if not raw:
+            return None
+        ss = _load_session(raw)
+        if turns:
+            ss.turns.extend(_load_turns(turns))
+        return ss
 
     def _list_ids(self, limit: int) -> List[str]:
         if self.r:
@@ -79,34 +145,75 @@ class SessionStore:
         return ss
 
     def save(self, ss: ChatSession) -> None:
-        self._save_raw(ss.id, ss.model_dump_json())
+        turns = [t.model_dump_json() for t in ss.turns]
+        if self.r:
+            p = self.r.pipeline()
+            self._save_header(ss, p)
+            p.delete(self._turns_key(ss.id))
+            if turns:
+                p.rpush(self._turns_key(ss.id), *turns)
+            p.execute()
+        else:
+            self._save_header(ss)
+            self.mem.replace_list(self._turns_key(ss.id), turns)
 
     def get(self, sid: str) -> Optional[ChatSession]:
-        raw = self._load_raw(sid)
-        if not raw:
-            return None
-        return ChatSession.model_validate_json(raw)
+        if self.r:
+            p = self.r.pipeline()
+            p.get(self._key(sid))
+            p.lrange(self._turns_key(sid), 0, -1)
+            raw, turns = p.execute()
+        else:
+            raw, turns = self.mem.get(self._key(sid)), self.mem.lrange(self._turns_key(sid))
+        return self._assemble(raw, turns)
 
     def list(self, limit: int = 100) -> List[ChatSession]:
-        out: List[ChatSession] = []
-        for sid in self._list_ids(limit):
-            ss = self.get(sid)
-            if ss:
-                out.append(ss)
-        return out
-
-    def add_turn(self, sid: str, turn: Turn) -> ChatSession:
-        ss = self.get(sid)
-        if not ss:
+        ids = self._list_ids(limit)
+        if not ids:
+            return []
+        keys = [self._key(s) for s in ids]
+        # one round-trip (or one lock acquisition) for the headers instead of a GET per session
+        if self.r:
+            p = self.r.pipeline()
+            p.mget(keys)
+            for s in ids:
+                p.lrange(self._turns_key(s), 0, -1)
+            raws, *turns = p.execute()
+        else:
+            raws = self.mem.get_many(keys)
+            turns = [self.mem.lrange(self._turns_key(s)) for s in ids]
+        out = (self._assemble(raw, t) for raw, t in zip(raws, turns))
+        return [ss for ss in out if ss]
+
+    def add_turn(self, sid: str, turn: Turn) -> None:
+        """Append `turn` without reading the history back; use get() for the full session."""
+        raw = self.r.get(self._key(sid)) if self.r else self.mem.get(self._key(sid))
+        if not raw:
             raise KeyError("session not found")
-        ss.turns.append(turn)
+        ss = _load_session(raw)
+        # legacy blob: move its embedded turns into the list ahead of the new one
+        items = [t.model_dump_json() for t in ss.turns] + [turn.model_dump_json()]
+        ss.turns = []
         ss.updated_ts = turn.ts
-        self.save(ss)
-        return ss
+        tkey = self._turns_key(sid)
+        if self.r:
+            p = self.r.pipeline()
+            self._save_header(ss, p)
+            p.rpush(tkey, *items)
+            if SESSION_MAX_TURNS > 0:
+                p.ltrim(tkey, -SESSION_MAX_TURNS, -1)
+            p.execute()
+        else:
+            self._save_header(ss)
+            self.mem.rpush(tkey, items, SESSION_MAX_TURNS)
 
     def set_title(self, sid: str, title: str) -> None:
-        ss = self.get(sid)
-        if not ss:
+        raw = self.r.get(self._key(sid)) if self.r else self.mem.get(self._key(sid))
+        if not raw:
             return
+        ss = _load_session(raw)
         ss.title = title
-        self.save(ss)
+        if ss.turns:  # legacy blob; save() splits the turns out
+            self.save(ss)
+        else:
+            self._save_header(ss)
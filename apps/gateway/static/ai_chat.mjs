@@ -0,0 +1,876 @@
+/* ---------------- Utils ---------------- */
+const $  = (s)=>document.querySelector(s);
+const $$ = (s)=>Array.from(document.querySelectorAll(s));
+function toast(m,ms=2200){const t=$("#toast");t.textContent=m;t.classList.add("show");setTimeout(()=>t.classList.remove("show"),ms)}
+function esc(s){return (s||"").replace(/&/g,"&amp;").replace(/</g,"&lt;")}
+function now(){return new Date().toLocaleTimeString()}
+function visionish(name){const n=(name||"").toLowerCase();return /vllm|vision|llava|bakllava|moondream|gpt-4o|llava\-phi|vl\-/.test(n)}
+function firstJSONBlock(t){
+  const fenced=t.match(/```json\s*([\s\S]*?)```/i); if(fenced){try{return JSON.parse(fenced[1])}catch{}}
+  const i=t.indexOf("{"), j=t.lastIndexOf("}"); if(i!==-1&&j>i){try{return JSON.parse(t.slice(i,j+1))}catch{}}
+  return null;
+}
+const PLACEHOLDER = 'data:image/svg+xml;utf8,'+encodeURIComponent('<svg xmlns="http://www.w3.org/2000/svg" width="40" height="40"><rect width="40" height="40" rx="8" fill="#eef2ff"/></svg>');
+const PDFICON = 'data:image/svg+xml;utf8,'+encodeURIComponent('<svg xmlns="http://www.w3.org/2000/svg" width="40" height="40"><rect width="40" height="40" rx="8" fill="#fef2f2"/><text x="20" y="24" text-anchor="middle" font-size="11" fill="#991b1b">PDF</text></svg>');
+
+/* ---------------- Field catalog ---------------- */
+// catalog + presets are rendered into the page by the server (see ai_chat.py)
+const { catalog: FIELD_CATALOG, presets: PRESETS } = JSON.parse(document.getElementById("aiChatFields").textContent);
+let selectedFields = JSON.parse(localStorage.getItem("pruva.fields.v1")||"null") || PRESETS.typical;
+function saveFields(){ localStorage.setItem("pruva.fields.v1", JSON.stringify(selectedFields)); }
+function renderFieldGrid(){
+  const mk=(id,arr,sel)=>{ const root=$(id); root.innerHTML="";
+    arr.forEach(k=>{
+      const lab=document.createElement("label");
+      lab.style.display="flex"; lab.style.alignItems="center"; lab.style.gap="6px";
+      lab.innerHTML=`<input type="checkbox" ${sel.includes(k)?"checked":""} data-k="${k}">${k}`;
+      lab.querySelector("input").onchange=e=>{
+        const list = id==="#fldHeader"?selectedFields.header: id==="#fldItem"?selectedFields.item:selectedFields.file;
+        const i=list.indexOf(k); e.target.checked ? (i==-1 && list.push(k)) : (i!=-1 && list.splice(i,1));
+        saveFields();
+      };
+      root.appendChild(lab);
+    });
+  };
+  mk("#fldHeader", FIELD_CATALOG.header, selectedFields.header);
+  mk("#fldItem", FIELD_CATALOG.item, selectedFields.item);
+  mk("#fldFile", FIELD_CATALOG.file, selectedFields.file);
+}
+$$('#icFields [data-preset]').forEach(b=>b.onclick=(e)=>{ e.stopPropagation();
+  selectedFields = JSON.parse(JSON.stringify(PRESETS[b.dataset.preset] || PRESETS.typical));
+  saveFields(); renderFieldGrid(); toast("Preset applied: "+b.dataset.preset);
+});
+
+/* ---------------- State (workspaces/chats) ---------------- */
+const STORE="pruva.ai.tree.v2";
+function uid(){return Math.random().toString(36).slice(2,10)}
+let state = JSON.parse(localStorage.getItem(STORE)||"null");
+if(!state){
+  const ws = uid(), ch = uid();
+  state = { workspaces:{}, curWs:ws, curChat:ch };
+  state.workspaces[ws] = {name:"Workspace 1", open:true, chats:{}};
+  state.workspaces[ws].chats[ch] = {name:"Chat 1", system:"", messages:[]};
+  localStorage.setItem(STORE, JSON.stringify(state));
+}
+function save(){ localStorage.setItem(STORE, JSON.stringify(state)); }
+function cur(){ return state.workspaces[state.curWs].chats[state.curChat]; }
+
+/* ---------------- Sidebar tree ---------------- */
+function inlineRename(el, current, cb){
+  const input=document.createElement("input"); input.value=current; input.className="inlineInput";
+  el.innerHTML=""; el.appendChild(input); input.focus(); input.select();
+  input.onkeydown=(e)=>{ if(e.key==="Enter"){ cb(input.value.trim()||current); } if(e.key==="Escape"){ cb(current,true); } };
+  input.onblur=()=>cb(input.value.trim()||current);
+}
+function renderTree(){
+  const T=$("#tree"); T.innerHTML="";
+  Object.entries(state.workspaces).forEach(([wsId,ws])=>{
+    const node=document.createElement("div"); node.className="node"+(ws.open?" open":"");
+    node.innerHTML=`
+      <div class="nodeHead">
+        <div class="nodeTitle" data-rename="ws">${esc(ws.name)}</div>
+        <span class="tag">${Object.keys(ws.chats).length} chats</span>
+        <div class="nodeAct">
+          <button class="btn" data-addchat>＋</button>
+          <button class="btn" data-rename>✎</button>
+          <button class="btn bad" data-del>🗑</button>
+        </div>
+      </div>
+      <div class="nodeBody"></div>`;
+    const head=node.querySelector(".nodeHead");
+    head.onclick=(e)=>{ if(e.target.closest(".nodeAct")) return; ws.open=!ws.open; save(); renderTree(); };
+    head.querySelector("[data-rename]").onclick=(e)=>{ e.stopPropagation(); inlineRename(node.querySelector('[data-rename="ws"]'), ws.name, (val,cancel)=>{ if(!cancel){ ws.name=val; save(); renderTree(); }}); };
+    head.querySelector("[data-addchat]").onclick=(e)=>{ e.stopPropagation(); const id=uid(); ws.chats[id]={name:"Thread "+(Object.keys(ws.chats).length+1), system:"", messages:[]}; state.curWs=wsId; state.curChat=id; save(); renderAll(); };
+    head.querySelector("[data-del]").onclick=(e)=>{ e.stopPropagation(); if(Object.keys(state.workspaces).length<=1) return toast("Keep at least one workspace"); if(confirm("Delete workspace?")){ delete state.workspaces[wsId]; state.curWs=Object.keys(state.workspaces)[0]; state.curChat=Object.keys(state.workspaces[state.curWs].chats)[0]; save(); renderAll(); } };
+
+    const body=node.querySelector(".nodeBody");
+    Object.entries(ws.chats).forEach(([chatId,ch])=>{
+      const item=document.createElement("div"); item.className="item"+(state.curWs===wsId && state.curChat===chatId?" active":"");
+      item.innerHTML=`<div style="flex:1" data-rename="chat">${esc(ch.name)}</div>
+        <div class="controls">
+          <button class="btn" data-rename>✎</button>
+          <button class="btn bad" data-del>🗑</button>
+        </div>`;
+      item.onclick=(e)=>{ if(e.target.closest(".controls")) return; state.curWs=wsId; state.curChat=chatId; save(); renderAll(); };
+      item.querySelector("[data-rename]").onclick=(e)=>{ e.stopPropagation(); inlineRename(item.querySelector('[data-rename="chat"]'), ch.name, (val,cancel)=>{ if(!cancel){ ch.name=val; save(); renderTree(); renderCrumb(); }}); };
+      item.querySelector("[data-del]").onclick=(e)=>{ e.stopPropagation(); if(Object.keys(ws.chats).length<=1) return toast("Keep one chat at least"); if(confirm("Delete chat?")){ delete ws.chats[chatId]; state.curWs=wsId; state.curChat=Object.keys(ws.chats)[0]; save(); renderAll(); } };
+      body.appendChild(item);
+    });
+    T.appendChild(node);
+  });
+}
+$("#wsAdd").onclick=()=>{ const id=uid(); state.workspaces[id]={name:"Workspace "+(Object.keys(state.workspaces).length+1), open:true, chats:{}}; const ch=uid(); state.workspaces[id].chats[ch]={name:"Chat 1", system:"", messages:[]}; state.curWs=id; state.curChat=ch; save(); renderAll(); };
+function renderCrumb(){ const ws=state.workspaces[state.curWs]; const ch=ws.chats[state.curChat]; $("#crumb").textContent=`${ws.name} / ${ch.name}`; }
+
+/* ---------------- Thread ---------------- */
+function bubble(role, text, opt={}){
+  const b=document.createElement("div");
+  b.className="bubble "+(role==="user"?"me":"ai");
+  b.innerHTML=`
+    <div class="meta"><b>${role==="user"?"You":"AI"}</b>
+      ${opt.model?`<span class="chip mono">${esc(opt.model)}</span>`:""}
+      <span class="small">${opt.time||now()}</span>
+    </div>
+    <div>${esc(text).replace(/\n/g,"<br>")}</div>
+  `;
+  if(opt.attach && opt.attach.length){
+    const row=document.createElement("div"); row.className="attachRow";
+    opt.attach.forEach(a=>{
+      const chip=document.createElement("span"); chip.className="attach";
+      const src = a.url || PLACEHOLDER;
+      chip.innerHTML=`<img src="${src}" alt=""><span class="small">${esc(a.name||"file")}</span>`;
+      row.appendChild(chip);
+    });
+    b.appendChild(row);
+  }
+  if(opt.extract){
+    const det=document.createElement("details"); det.className="disc";
+    det.innerHTML=`<summary>Extracted JSON</summary><pre class="json">${esc(JSON.stringify(opt.extract,null,2))}</pre>`;
+    b.appendChild(det);
+  }
+  if(opt.raw){
+    const det=document.createElement("details"); det.className="disc";
+    det.innerHTML=`<summary>Model raw</summary><pre class="json">${esc(JSON.stringify(opt.raw,null,2))}</pre>`;
+    b.appendChild(det);
+  }
+  return b;
+}
+function renderThread(){
+  const t=$("#thread"); t.innerHTML="";
+  (cur().messages||[]).forEach(m=>{
+    const atts=(m.attach||[]).map(a=>({url:a.url,name:a.name}));
+    t.appendChild(bubble(m.role, m.content||"", {model:m.model, time:m.time, attach:atts, extract:m.extract, raw:m.raw}));
+  });
+  t.scrollTop=t.scrollHeight;
+}
+
+/* ---------------- Models ---------------- */
+async function reloadModels(){
+  const sel=$("#modelSel"); sel.innerHTML=`<option>Loading…</option>`;
+  try{
+    const js=await (await fetch("/api/llm/models")).json();
+    sel.innerHTML=""; (js.models||[]).forEach(m=>{ const o=document.createElement("option"); o.value=m.name; o.textContent=m.name; sel.appendChild(o); });
+    if(sel.dataset.default && [...sel.options].some(o=>o.value===sel.dataset.default)) sel.value=sel.dataset.default;
+  }catch{ sel.innerHTML=`<option value="">(no models)</option>`; }
+}
+$("#btnExportChat").onclick=()=>{ const ws=state.workspaces[state.curWs], ch=ws.chats[state.curChat]; const data=JSON.stringify(ch,null,2); const url=URL.createObjectURL(new Blob([data],{type:"application/json"})); const a=document.createElement("a"); a.href=url; a.download=`${ws.name}__${ch.name}.json`; a.click(); URL.revokeObjectURL(url); };
+$("#btnClearChat").onclick=()=>{ if(confirm("Clear this chat?")){ cur().messages=[]; save(); renderThread(); } };
+
+/* ---------------- Icons popups ---------------- */
+function togglePop(ic){ ic.classList.toggle("open"); }
+$("#icFields").addEventListener("click",(e)=>{ if(e.target.closest(".pop")) return; togglePop($("#icFields")); });
+$("#icSys").addEventListener("click",(e)=>{ if(e.target.closest(".pop")) return; togglePop($("#icSys")); });
+$("#icHelp").addEventListener("click",(e)=>{ if(e.target.closest(".pop")) return; togglePop($("#icHelp")); });
+$("#icDataset").addEventListener("click",(e)=>{ if(e.target.closest(".pop")) return; togglePop($("#icDataset")); });
+document.addEventListener("click",(e)=>{ [$("#icFields"),$("#icSys"),$("#icHelp"),$("#icDataset")].forEach(ic=>{ if(ic && !ic.contains(e.target)) ic.classList.remove("open"); }); });
+
+renderFieldGrid();
+
+/* ---------------- Attachments: local files ---------------- */
+let staged=[], stagedUrls=[];
+function refreshThumbs(){
+  const wrap=$("#thumbs"); wrap.innerHTML="";
+  // local uploads
+  stagedUrls.forEach((u,i)=>{
+    const d=document.createElement("div"); d.className="thumb";
+    d.innerHTML=`<img src="${u}" alt=""><button class="x">×</button>`;
+    d.querySelector(".x").onclick=()=>{ URL.revokeObjectURL(stagedUrls[i]); staged.splice(i,1); stagedUrls.splice(i,1); refreshThumbs(); };
+    wrap.appendChild(d);
+  });
+  // dataset picks
+  DATASET.selected.forEach((ref, idx)=>{
+    const url = previewURL(ref) || (isPDF(ref.type)?PDFICON:PLACEHOLDER);
+    const d=document.createElement("div"); d.className="thumb"; d.innerHTML=`<img src="${url}" alt=""><button class="x">×</button>`;
+    d.title = ref.name || ref.key;
+    d.querySelector(".x").onclick=()=>{ DATASET._selectedKeys.delete(ref.key); DATASET.selected.splice(idx,1); refreshThumbs(); };
+    wrap.appendChild(d);
+  });
+}
+$("#filePick").onchange=e=>{ const files=[...e.target.files]; files.forEach(f=>{ staged.push(f); stagedUrls.push(URL.createObjectURL(f)); }); e.target.value=""; refreshThumbs(); };
+const dz=$("#dropzone");
+["dragenter","dragover"].forEach(ev=>dz.addEventListener(ev,e=>{e.preventDefault();dz.style.outline="2px dashed #a3bffa"}));
+["dragleave","drop"].forEach(ev=>dz.addEventListener(ev,e=>{e.preventDefault();dz.style.outline="none"}));
+dz.addEventListener("drop",e=>{ const files=[...e.dataTransfer.files]; files.forEach(f=>{ staged.push(f); stagedUrls.push(URL.createObjectURL(f)); }); refreshThumbs(); });
+async function uploadStaged(sessionId){
+  if(!staged.length) return [];
+  const fd=new FormData(); fd.append("session_id", sessionId);
+  staged.forEach(f=>fd.append("files", f));
+  try{
+    const r=await fetch("/api/llm/upload",{method:"POST",body:fd});
+    const js=await r.json(); if(!r.ok||js.error) throw 0;
+    return (js.files||[]); 
+  }catch{ toast("Upload failed"); return []; }
+}
+
+/* ---------------- Dataset picker ---------------- */
+const DATASET = { list:[], selected:[], _selectedKeys:new Set() }; // flat *files* with expense context; _selectedKeys mirrors selected[].key
+let LAST_DS_RAW = null;
+
+function showDsRaw(raw){
+  LAST_DS_RAW = raw;
+  $("#dsRaw").textContent = typeof raw==='string' ? raw : JSON.stringify(raw,null,2);
+  $("#dsRawWrap").style.display = 'block';
+}
+
+/* ---------- Expense→Files expansion layer ---------- */
+function looksLikeExpense(o){
+  if(!o || typeof o!=="object") return false;
+  const hasExpenseish = ("Kod" in o) || ("Tedarikci" in o) || ("MasrafTarihi" in o) || ("internal_detail" in o);
+  const hasFileish = o?.internal_detail?.MasrafAlt || o?.Files || o?.files || o?.images || o?.attachments;
+  return hasExpenseish && !hasFileish;
+}
+function getExpenseId(o){
+  return o?.Kod || o?.kod || o?.id || o?.Id || o?._id || o?.uuid || o?.Hash || o?.hash || o?.Code || "";
+}
+
+async function fetchFilesForExpense(exp, signal){
+  // embedded?
+  const embed = exp?.internal_detail?.MasrafAlt;
+  if (embed && typeof embed==="object"){
+    const out=[];
+    Object.values(embed).forEach(alt=>{
+      const dos=alt.Dosya||alt.Files||alt.files||alt.images;
+      if(Array.isArray(dos)) out.push(...dos);
+      else if(dos && typeof dos==="object") out.push(...Object.values(dos));
+    });
+    if(out.length) return out;
+  }
+  const id=getExpenseId(exp);
+  const q=encodeURIComponent(id);
+
+  // preferred: get the full expense like your Data Source page
+  const fullCandidates = [
+    `/api/expense/${q}`,
+    `/api/expense?kod=${q}`,
+    `/api/expense?id=${q}`
+  ];
+  for(const u of fullCandidates){
+    try{
+      const r=await fetch(u,{signal});
+      if(!r.ok) continue;
+      const js=await r.json().catch(()=>null);
+      if(js && js.internal_detail && js.internal_detail.MasrafAlt){
+        const acc=[];
+        Object.values(js.internal_detail.MasrafAlt).forEach(alt=>{
+          const f=alt.Dosya||alt.Files||alt.files||alt.images;
+          if(Array.isArray(f)) acc.push(...f);
+          else if(f && typeof f==="object") acc.push(...Object.values(f));
+        });
+        if(acc.length) return acc;
+      }
+    }catch{}
+    if(signal?.aborted) return [];
+  }
+
+  // fallbacks: explicit file lists
+  const getCandidates = [
+    `/api/dataset/expense_files?kod=${q}`,
+    `/api/dataset/expense_files?id=${q}`,
+    `/api/dataset/files?expense_id=${q}`,
+    `/api/dataset/files?Kod=${q}`,
+    `/api/expense/${q}/files`,
+    `/api/expenses/${q}/files`,
+    `/api/expense_files?expense_id=${q}`
+  ];
+  for(const url of getCandidates){
+    try{
+      const r=await fetch(url,{signal});
+      if(!r.ok) continue;
+      const js=await r.json().catch(()=>null);
+      const arr = Array.isArray(js) ? js : (js?.files || js?.items || js?.data || js?.results);
+      if (Array.isArray(arr) && arr.length) return arr;
+    }catch{}
+    if(signal?.aborted) return [];
+  }
+
+  // POST fallbacks accepting payloads (some gateways expect POST)
+  const postCandidates = [
+    {url:'/api/dataset/expense_files', data:{expense:exp}},
+    {url:'/api/expense_files', data:{expense:exp}},
+  ];
+  for(const c of postCandidates){
+    try{
+      const r=await fetch(c.url,{method:'POST',headers:{'content-type':'application/json'},body:JSON.stringify(c.data),signal});
+      if(!r.ok) continue;
+      const js=await r.json().catch(()=>null);
+      const arr = Array.isArray(js) ? js : (js?.files || js?.items || js?.data || js?.results);
+      if (Array.isArray(arr) && arr.length) return arr;
+    }catch{}
+  }
+
+  return [];
+}
+
+/* ---------------- Normalization ---------------- */
+const RX_PDF=/\.pdf$/i, RX_IMG_EXT=/\.(png|jpe?g|webp|gif)$/i, RX_HTTP=/^https?:/i, RX_EXT=/\.[^\.]+$/, RX_UNSAFE_NAME=/[^\w.\-]+/g;
+function isPDF(mt){ return (mt||"").toLowerCase().includes("pdf") || RX_PDF.test(mt||""); }
+function isImageType(mtOrName){ const s=(mtOrName||"").toLowerCase(); return s.startsWith("image/") || RX_IMG_EXT.test(s); }
+
+// memoized per row (write-once); a symbol key keeps it out of JSON.stringify
+const PURL = Symbol("purl");
+function previewURL(row){
+  if (row[PURL] !== undefined) return row[PURL];
+  return (row[PURL] = computePreviewURL(row));
+}
+function computePreviewURL(row){
+  // synthesize preview url from FileId/Hash if present (your /api/preview flow)
+  const f = row?.meta?.file || {};
+  const ctx = row?.meta?.context || {};
+  const fid = f.FileId || f.fileId || f.fid;
+  const fh  = f.FileHash || f.fileHash || f.Hash;
+  const kod = ctx.Kod || ctx.kod;
+  if (fid && fh && kod){
+    return `/api/preview?kod=${encodeURIComponent(kod)}&fid=${encodeURIComponent(fid)}&hash=${encodeURIComponent(fh)}`;
+  }
+  const direct = f.signed_url || f.SignedUrl || f.url || f.Url || f.public_url || f.preview_url || row.url;
+  if (direct) return direct;
+  if (typeof row.key === "string" && RX_HTTP.test(row.key)) return row.key;
+  const key = encodeURIComponent(row.key||"");
+  if (!key) return "";
+  return `/api/dataset/preview?key=${key}`;
+}
+
+// candidate field names, in priority order (one fixed-shape walk each instead of long || chains)
+const FILE_KEY_KEYS  = ["s3_key_image","s3_key","S3Key","s3Path","S3Path","fileHash","Hash","Kod","path","key","url","Url"];
+const FILE_NAME_KEYS = ["OrjinalAdi","Adi","original","name","FileName"];
+const FILE_MIME_KEYS = ["MimeType","mime","content_type"];
+const FILE_SIZE_KEYS = ["Size","size_bytes","FileSize"];
+const FILE_URL_KEYS  = ["url","signed_url","SignedUrl","preview_url"];
+function firstOf(obj, keys){
+  for(let i=0; i<keys.length; i++){ const v=obj[keys[i]]; if(v) return v; }
+  return undefined;
+}
+
+function normalizeFileRow(file, expenseCtx={}){
+  const key = firstOf(file, FILE_KEY_KEYS) || (file.FileId && file.FileHash ? `${expenseCtx?.Kod||''}:${file.FileId}:${file.FileHash}` : "");
+  if(!key) return null;
+  const name = firstOf(file, FILE_NAME_KEYS) || (expenseCtx?.Tedarikci?`${expenseCtx.Tedarikci}-${(file.Kod||file.Hash||file.FileHash||'file')}`:'file');
+  const guessFromName = RX_PDF.test(typeof name==="string" ? name : String(name)) ? "application/pdf" : (isImageType(name) ? "image/*" : "file");
+  const type = String(firstOf(file, FILE_MIME_KEYS) || "").toLowerCase() || guessFromName;
+  const row = {
+    key,
+    name,
+    type,
+    size: firstOf(file, FILE_SIZE_KEYS) || 0,
+    url: firstOf(file, FILE_URL_KEYS) || "",
+    meta: { file, context: expenseCtx }
+  };
+  // attach preview if we can synthesize
+  const p = previewURL(row);
+  if (p) row.url = p;
+  return row;
+}
+
+// "exp" (walk as expense), "file" (single file row) or null (ignore)
+const EXPENSE_MARKERS=["Files","files","images","attachments"];
+const FILE_MARKERS=["Dosya","OrjinalAdi","S3Key","s3_key_image","key","path","url","FileId"];
+function classifyItem(it){
+  if(it==null) return null;
+  if(looksLikeExpense(it) || it.internal_detail?.MasrafAlt) return "exp";
+  for(let i=0; i<EXPENSE_MARKERS.length; i++) if(it[EXPENSE_MARKERS[i]]) return "exp";
+  for(let i=0; i<FILE_MARKERS.length; i++) if(it[FILE_MARKERS[i]]) return "file";
+  return null;
+}
+
+// First pass: flatten any embedded files, record "expenses missing files"
+function normalizeFirstPass(input){
+  const fileRows=[];
+  const expenseRows=[];
+  const pushFile=(row)=>{ if(row && row.key) fileRows.push(row); };
+
+  const takeFilesArray=(arr, ctx)=>{ if(Array.isArray(arr)) arr.forEach(f=>pushFile(normalizeFileRow(f, ctx||{}))); };
+
+  const walkExpense=(exp)=>{
+    const det=exp?.internal_detail;
+    const ctx=(det?.masraf || exp?.masraf || {});
+    if (exp?.Kod && !ctx.Kod) ctx.Kod = exp.Kod; // ensure Kod is present in ctx for preview urls
+
+    const MasrafAlt = det?.MasrafAlt;
+    if(MasrafAlt && typeof MasrafAlt==="object"){
+      Object.values(MasrafAlt).forEach(alt=>{
+        const files = alt.Dosya || alt.Files || alt.files || alt.images;
+        if (Array.isArray(files)) files.forEach(f=>pushFile(normalizeFileRow(f, {...ctx, ...alt})));
+        else if (files && typeof files==="object"){ Object.values(files).forEach(f=>pushFile(normalizeFileRow(f, {...ctx, ...alt}))); }
+      });
+    }
+    takeFilesArray(exp?.Files, ctx);
+    takeFilesArray(exp?.files, ctx);
+    takeFilesArray(exp?.images, ctx);
+    takeFilesArray(exp?.attachments, ctx);
+
+    if(!(MasrafAlt||exp?.Files||exp?.files||exp?.images||exp?.attachments)) expenseRows.push(exp);
+  };
+
+  const tryArray=(arr)=>{
+    if(!Array.isArray(arr)) return false;
+    arr.forEach(it=>{
+      switch(classifyItem(it)){
+        case "exp": walkExpense(it); break;
+        case "file": pushFile(normalizeFileRow(it, {})); break;
+      }
+    });
+    return true;
+  };
+
+  if(tryArray(input)) return {fileRows, expenseRows};
+  const maybeArr = input?.items || input?.data || input?.results || input?.expenses || input?.files || input?.Files;
+  if(tryArray(maybeArr)) return {fileRows, expenseRows};
+
+  if(input && typeof input==="object"){
+    const kind=classifyItem(input);
+    if(kind==="exp") walkExpense(input);
+    else if(kind==="file") pushFile(normalizeFileRow(input, {}));
+  }
+  return {fileRows, expenseRows};
+}
+
+/* ---------- Load from API then EXPAND expenses to files ---------- */
+// NDJSON: rewrite the line breaks between records into commas and parse once as an array;
+// per-line parsing (skipping bad lines) only if that fails.
+function parseNDJSON(txt){
+  const body=txt.trim();
+  if(!body) return [];
+  try{
+    const arr=JSON.parse("["+body.replace(/}\s*\r?\n\s*{/g,"},{")+"]");
+    if(Array.isArray(arr)) return arr;
+  }catch{}
+  const arr=[];
+  for(const ln of body.split(/\r?\n/)){ const s=ln.trim(); if(!s) continue; try{ arr.push(JSON.parse(s)); }catch{} }
+  return arr;
+}
+
+async function fetchDatasetFlexible(){
+  const paths = ["/api/dataset/list","/api/dataset","/api/dataset/items","/api/expenses"];
+  let lastErr=null;
+  for(const p of paths){
+    try{
+      const r=await fetch(p);
+      const txt=await r.text();
+      if(!r.ok) { lastErr=txt||r.status; continue; }
+      try{
+        const js=JSON.parse(txt); showDsRaw(js); return js;
+      }catch{
+        const arr=parseNDJSON(txt);
+        if(arr.length){ showDsRaw(arr); return arr; }
+        showDsRaw(txt); return txt;
+      }
+    }catch(e){ lastErr=e; }
+  }
+  toast("Dataset API not available ("+(lastErr||"no response")+")");
+  showDsRaw(String(lastErr||""));
+  return null;
+}
+
+function groupKey(ctx){
+  return String(ctx?.Kod || ctx?.MasrafTarihi || ctx?.Tedarikci || ctx?.Aciklama || "Expense");
+}
+function groupTitle(ctx){
+  const parts=[ctx?.Tedarikci||"Expense", ctx?.MasrafTarihi, ctx?.ToplamMasrafTutari].filter(Boolean);
+  return parts.join(" · ");
+}
+
+/* #dsList is windowed: one flat entry list (group heads + file rows), a spacer for the full
+   height, and only the entries inside the viewport (+overscan) are materialized from a node pool. */
+const DS_HEAD_H=34, DS_ROW_H=48, DS_PAD=6, DS_OVERSCAN=6;
+const dsView={ entries:[], tops:[], groups:{}, checked:new Set(), mounted:new Map(), pool:{head:[], row:[]}, raf:0 };
+
+function dsMakeNode(type){
+  const n=document.createElement(type==="head"?"div":"label");
+  n.style.position="absolute"; n.style.left=DS_PAD+"px"; n.style.right=DS_PAD+"px";
+  n.style.display="grid"; n.style.alignItems="center"; n.style.padding="6px"; n.style.boxSizing="border-box";
+  if(type==="head"){
+    n.style.height=DS_HEAD_H+"px"; n.style.gridTemplateColumns="auto 1fr auto"; n.style.gap="8px";
+    n.style.background="#f8fafc"; n.style.border="1px solid var(--line)"; n.style.borderRadius="10px 10px 0 0";
+    n.innerHTML=`<input type="checkbox"><b></b><span class="small"></span>`;
+  }else{
+    n.style.height=DS_ROW_H+"px"; n.style.gridTemplateColumns="auto auto 1fr auto"; n.style.gap="10px";
+    n.style.borderLeft=n.style.borderRight=n.style.borderBottom="1px solid var(--line)";
+    n.innerHTML=`<input type="checkbox"><div class="preview"><img alt=""></div><div style="min-width:0"><b></b><div class="small mono" style="overflow:hidden;text-overflow:ellipsis;white-space:nowrap"></div></div><span class="tag"></span>`;
+    n.querySelector("img").onerror=function(){ if(this.src!==PLACEHOLDER) this.src=PLACEHOLDER; };
+  }
+  return n;
+}
+
+function dsFillNode(n, k){
+  const e=dsView.entries[k];
+  n.dataset.k=k; n.style.top=(DS_PAD+dsView.tops[k])+"px";
+  const cb=n.querySelector("input"); cb.checked=dsView.checked.has(k);
+  if(e.type==="head"){
+    n.querySelector("b").textContent=groupTitle(e.g.ctx);
+    n.querySelector("span").textContent=`${e.g.items.length} file(s)`;
+  }else{
+    const r=e.r;
+    const purl = isPDF(r.type) ? PDFICON : (previewURL(r) || PLACEHOLDER);
+    const img=n.querySelector("img"); if(img.getAttribute("src")!==purl) img.src=purl;
+    n.querySelector("b").textContent=r.name||r.key;
+    n.querySelector(".mono").textContent=r.key;
+    n.querySelector(".tag").textContent=r.type||"file";
+  }
+}
+
+function dsPaint(){
+  dsView.raf=0;
+  const box=$("#dsList"), {entries, tops, mounted, pool}=dsView;
+  if(!entries.length) return;
+  const y0=Math.max(0, box.scrollTop-DS_PAD), y1=y0+box.clientHeight;
+  let lo=0, hi=entries.length-1;
+  while(lo<hi){ const mid=(lo+hi+1)>>1; if(tops[mid]<=y0) lo=mid; else hi=mid-1; }
+  let end=lo; while(end<entries.length-1 && tops[end+1]<y1) end++;
+  const first=Math.max(0, lo-DS_OVERSCAN), last=Math.min(entries.length-1, end+DS_OVERSCAN);
+  mounted.forEach((n,k)=>{ if(k<first || k>last){ n.remove(); pool[entries[k].type].push(n); mounted.delete(k); } });
+  // fill detached nodes, then insert them with a single DOM write
+  const frag=document.createDocumentFragment();
+  for(let k=first; k<=last; k++){
+    if(mounted.has(k)) continue;
+    const type=entries[k].type;
+    const n=pool[type].pop() || dsMakeNode(type);
+    dsFillNode(n, k); frag.appendChild(n); mounted.set(k, n);
+  }
+  if(frag.firstChild) box.appendChild(frag);
+}
+function dsSchedulePaint(){ if(!dsView.raf) dsView.raf=requestAnimationFrame(dsPaint); }
+
+function renderDatasetList(){
+  const box=$("#dsList"); box.innerHTML="";
+  dsView.entries=[]; dsView.tops=[]; dsView.groups={}; dsView.checked.clear(); dsView.mounted.clear();
+  if(!DATASET.list.length){ box.innerHTML=`<div class="small" style="padding:6px">No items yet. Click “Load from API” or paste JSON.</div>`; return; }
+
+  const groups=dsView.groups;
+  DATASET.list.forEach(r=>{
+    const ctx=r.meta?.context||{};
+    const gid=groupKey(ctx);
+    (groups[gid]=groups[gid]||{ctx, items:[], head:0}).items.push(r);
+  });
+
+  let y=0;
+  Object.entries(groups).forEach(([gid,g])=>{
+    y+=dsView.entries.length?DS_PAD:0;
+    g.head=dsView.entries.length;
+    dsView.entries.push({type:"head", gid, g}); dsView.tops.push(y); y+=DS_HEAD_H;
+    g.items.forEach((r,i)=>{ dsView.entries.push({type:"row", gid, i, r}); dsView.tops.push(y); y+=DS_ROW_H; });
+  });
+
+  box.style.position="relative";
+  const spacer=document.createElement("div"); spacer.style.height=y+"px";
+  box.appendChild(spacer);
+  dsPaint();
+}
+
+$("#dsList").addEventListener("scroll", dsSchedulePaint, {passive:true});
+new ResizeObserver(dsSchedulePaint).observe($("#dsList"));   // popup opened / resized
+$("#dsList").addEventListener("change", e=>{
+  const node=e.target.closest("[data-k]"); if(!node) return;
+  const k=Number(node.dataset.k), ent=dsView.entries[k], on=e.target.checked;
+  on ? dsView.checked.add(k) : dsView.checked.delete(k);
+  if(ent.type==="head"){
+    // whole group: mirror into every file row, mounted or not
+    ent.g.items.forEach((_,i)=>{ const rk=ent.g.head+1+i; on ? dsView.checked.add(rk) : dsView.checked.delete(rk); const n=dsView.mounted.get(rk); if(n) n.querySelector("input").checked=on; });
+  }
+});
+
+$("#btnApplyDataset").onclick=(e)=>{
+  e.stopPropagation();
+
+  const whole=[], pickedRows = Object.create(null);
+  dsView.checked.forEach(k=>{
+    const ent=dsView.entries[k]; if(!ent) return;
+    if(ent.type==="head"){ whole.push(ent.gid); ent.g.items.forEach(r=>{ pickedRows[r.key]=r; }); }
+    else pickedRows[ent.r.key]=ent.r;
+  });
+
+  const picked=Object.values(pickedRows);
+  if(!picked.length){ toast("Nothing selected"); return; }
+
+  const keys=DATASET._selectedKeys;
+  let added=0;
+  picked.forEach(r=>{
+    if(!keys.has(r.key)){
+      DATASET.selected.push({key:r.key, name:r.name||r.key, type:r.type, url: previewURL(r)});
+      keys.add(r.key);
+      added++;
+    }
+  });
+
+  refreshThumbs();
+  toast(`${added} file(s) added from ${whole.length} expense(s)`);
+};
+
+// Promise.allSettled-shaped results, at most `limit` fn() calls in flight, input order kept
+async function pool(items, limit, fn){
+  const ret=new Array(items.length); let i=0;
+  const worker=async()=>{
+    while(i<items.length){
+      const k=i++;
+      ret[k]=await fn(items[k]).then(value=>({status:"fulfilled",value}), reason=>({status:"rejected",reason}));
+    }
+  };
+  await Promise.all(Array.from({length:Math.min(limit, items.length)}, worker));
+  return ret;
+}
+
+const EXPENSE_FETCH_CONCURRENCY=8;
+let dsLoadCtl=null;   // aborts the in-flight expense fan-out on reload / navigation
+window.addEventListener("pagehide", ()=>dsLoadCtl?.abort());
+
+async function loadDatasetFromAPI(){
+  dsLoadCtl?.abort();
+  const ctl=dsLoadCtl=new AbortController();
+  $("#dsList").innerHTML=`<div class="small" style="padding:6px">Loading…</div>`;
+  const raw = await fetchDatasetFlexible();
+  if(raw==null){ DATASET.list=[]; renderDatasetList(); return; }
+
+  const {fileRows, expenseRows} = normalizeFirstPass(raw);
+
+  let expandedFiles=[];
+  if(expenseRows.length){
+    const results = await pool(expenseRows, EXPENSE_FETCH_CONCURRENCY, async exp=>{
+      const ctx = exp?.internal_detail?.masraf || exp?.masraf || {};
+      if (exp?.Kod && !ctx.Kod) ctx.Kod = exp.Kod;
+      const files = await fetchFilesForExpense(exp, ctl.signal);
+      return files.map(f=>normalizeFileRow(f, ctx)).filter(Boolean);
+    });
+    if(ctl.signal.aborted) return;   // superseded by a newer load
+    results.forEach(r=>{ if(r.status==="fulfilled" && Array.isArray(r.value)) expandedFiles.push(...r.value); });
+  }
+
+  DATASET.list = [...fileRows, ...expandedFiles];
+
+  if(!DATASET.list.length){
+    toast("Loaded but no files found. Check the raw payload and file endpoints (debug below).");
+  }else{
+    toast(`Loaded ${DATASET.list.length} file(s) from ${expenseRows.length} expense(s)`);
+  }
+  renderDatasetList();
+}
+$("#btnLoadDataset").onclick=(e)=>{ e.stopPropagation(); loadDatasetFromAPI(); };
+
+$("#btnParseJson").onclick=(e)=>{
+  e.stopPropagation();
+  const txt=$("#dsJson").value.trim();
+  if(!txt) return toast("Paste JSON first");
+  try{
+    const obj=JSON.parse(txt);
+    showDsRaw(obj);
+    const first = normalizeFirstPass(obj);
+    DATASET.list = [...first.fileRows];
+    renderDatasetList(); toast(`Parsed ${DATASET.list.length} file(s)`);
+  }catch{ toast("Invalid JSON"); }
+};
+
+/* ---------------- OCR ---------------- */
+// Streaming request bodies (fetch duplex:"half") need a browser + origin that allow them
+// (Chromium over HTTP/2); detect support and otherwise send a regular FormData body.
+const SUPPORTS_REQUEST_STREAMS = (()=>{
+  try{
+    let duplexAccessed=false;
+    const hasContentType=new Request("data:,",{body:new ReadableStream(), method:"POST", get duplex(){ duplexAccessed=true; return "half"; }}).headers.has("Content-Type");
+    return duplexAccessed && !hasContentType;
+  }catch{ return false; }
+})();
+
+async function* multipartChunks(parts, boundary){
+  const enc=new TextEncoder();
+  for(const p of parts){
+    yield enc.encode(p.file
+      ? `--${boundary}\r\nContent-Disposition: form-data; name="${p.name}"; filename="${String(p.file.name||"file").replace(/["\r\n]/g,"_")}"\r\nContent-Type: ${p.file.type||"application/octet-stream"}\r\n\r\n`
+      : `--${boundary}\r\nContent-Disposition: form-data; name="${p.name}"\r\n\r\n`);
+    if(p.file){
+      const rd=p.file.stream().getReader();
+      for(;;){ const {done,value}=await rd.read(); if(done) break; yield value; }
+    }else yield enc.encode(p.value);
+    yield enc.encode("\r\n");
+  }
+  yield enc.encode(`--${boundary}--\r\n`);
+}
+function multipartStream(parts, boundary){
+  const it=multipartChunks(parts, boundary);
+  return new ReadableStream({
+    async pull(ctl){ const {done,value}=await it.next(); if(done) ctl.close(); else ctl.enqueue(value); },
+    cancel(){ it.return(); }
+  });
+}
+
+async function postMultipart(url, parts, signal){
+  if(SUPPORTS_REQUEST_STREAMS){
+    const boundary="----pruva"+Math.random().toString(36).slice(2)+Date.now().toString(36);
+    try{
+      return await fetch(url,{method:"POST", headers:{"content-type":`multipart/form-data; boundary=${boundary}`}, body:multipartStream(parts, boundary), duplex:"half", signal});
+    }catch(e){ if(signal?.aborted) throw e; }   // e.g. HTTP/1.1 origin: resend buffered
+  }
+  const fd=new FormData();
+  parts.forEach(p=>p.file ? fd.append(p.name, p.file) : fd.append(p.name, p.value));
+  return fetch(url,{method:"POST", body:fd, signal});
+}
+
+let ocrCtl=null;   // click the status chip to cancel a running OCR request
+$("#status").addEventListener("click", ()=>ocrCtl?.abort());
+
+async function runOCRPreview(){
+  if(!staged.length && !DATASET.selected.length) return toast("Attach files first");
+  const parts=staged.map(f=>({name:"files", file:f}));
+  if(DATASET.selected.length){ parts.push({name:"dataset_keys", value:JSON.stringify(DATASET.selected.map(x=>x.key))}); }
+  ocrCtl?.abort();
+  const ctl=ocrCtl=new AbortController();
+  $("#status").style.display="inline-flex";
+  try{
+    const r=await postMultipart("/api/ocr/extract", parts, ctl.signal);
+    const js=await r.json().catch(()=>null);
+    if(ocrCtl!==ctl) return;  // superseded by a newer run; that one owns the status chip
+    $("#status").style.display="none";
+    if(!r.ok||!js){ addMsg("assistant","(OCR error)"); return; }
+    addMsg("assistant", js.text || "(OCR done)", {raw:js});
+  }catch{
+    if(ocrCtl!==ctl) return;
+    $("#status").style.display="none"; addMsg("assistant", ctl.signal.aborted ? "(OCR cancelled)" : "(network error)");
+  }
+  finally{ if(ocrCtl===ctl) ocrCtl=null; }
+}
+$("#btnRunOCR").onclick=runOCRPreview;
+
+/* ---------------- DATASET → IMAGE TOKENS (for VLLM etc.) ---------------- */
+async function resolveImageUrlsForRef(ref){
+  const f = ref?.meta?.file || {};
+  const ctx = ref?.meta?.context || {};
+  if ((f.FileId||f.fileId||f.fid) && (f.FileHash||f.fileHash||f.Hash) && (ctx.Kod||ctx.kod)){
+    const fid = f.FileId || f.fileId || f.fid;
+    const fh  = f.FileHash || f.fileHash || f.Hash;
+    const kod = ctx.Kod || ctx.kod;
+    // ask preview service to render all pages if PDF
+    return [`/api/preview?kod=${encodeURIComponent(kod)}&fid=${encodeURIComponent(fid)}&hash=${encodeURIComponent(fh)}&all=1`];
+  }
+  const key = encodeURIComponent(ref.key||"");
+  const candidatesJSON = [
+    `/api/dataset/images?key=${key}`,
+    `/api/dataset/preview?key=${key}&all=1`,
+    `/api/dataset/pages?key=${key}`
+  ];
+  for(const u of candidatesJSON){
+    try{
+      const r = await fetch(u);
+      if(!r.ok) continue;
+      const js = await r.json().catch(()=>null);
+      if(js && Array.isArray(js.images) && js.images.length) return js.images;
+    }catch{}
+  }
+  if (ref.url && isImageType(ref.url)) return [ref.url];
+  if (isImageType(ref.type) || isImageType(ref.name) ){
+    return [`/api/dataset/file?key=${key}`];
+  }
+  return [`/api/dataset/preview?key=${key}`];
+}
+async function fetchAsFile(url, filenameFallback){
+  const r = await fetch(url);
+  if(!r.ok) throw new Error("fetch fail");
+  const blob = await r.blob();
+  let name = filenameFallback;
+  const ct = (r.headers.get("content-type")||"").toLowerCase();
+  if(ct.startsWith("image/")){
+    const ext = ct.split("/")[1].split(";")[0] || "jpg";
+    if(!RX_IMG_EXT.test(name)) name = name.replace(RX_EXT,"")+"."+ext;
+  }
+  return new File([blob], name, {type: ct || "image/jpeg"});
+}
+const PAGE_FETCH_CONCURRENCY=6;
+async function datasetSelectedToImageTokens(sessionId){
+  if(!DATASET.selected.length) return [];
+  // resolve every ref, then fetch all pages; both through the bounded pool, order kept
+  const resolved = await pool(DATASET.selected, PAGE_FETCH_CONCURRENCY, resolveImageUrlsForRef);
+  const pages = [];
+  resolved.forEach((res, k)=>{
+    if(res.status!=="fulfilled" || !Array.isArray(res.value)) return;
+    const ref = DATASET.selected[k];
+    const safeNameBase = (ref.name || ref.key || "file").replace(RX_UNSAFE_NAME,"_");
+    res.value.forEach((u, i)=>pages.push({url:u, name:`${safeNameBase}_${i+1}.jpg`}));
+  });
+  const fetched = await pool(pages, PAGE_FETCH_CONCURRENCY, p=>fetchAsFile(p.url, p.name));
+  const filesToUpload = fetched.filter(x=>x.status==="fulfilled").map(x=>x.value);
+  if(!filesToUpload.length) return [];
+  const fd = new FormData();
+  fd.append("session_id", sessionId);
+  filesToUpload.forEach(f=>fd.append("files", f));
+  try{
+    const r=await fetch("/api/llm/upload",{method:"POST",body:fd});
+    const js=await r.json();
+    if(!r.ok || js.error) throw 0;
+    return (js.files||[]).map(x=>x.token);
+  }catch{
+    toast("Failed to materialize dataset files as images");
+    return [];
+  }
+}
+
+/* ---------------- Send ---------------- */
+function addMsg(role, content, extras={}){
+  const m={role, content, time:now(), ...extras};
+  cur().messages=cur().messages||[]; cur().messages.push(m); save(); renderThread();
+}
+function keySend(e){ if(e.key==="Enter" && !e.shiftKey){ e.preventDefault(); $("#btnSend").click(); } }
+$("#msgBox").addEventListener("keydown", keySend);
+
+async function send(){
+  const text=$("#msgBox").value.trim();
+  const model=$("#modelSel").value||"";
+  const wantOCR=$("#chkOcr").checked;
+  if(!text && !staged.length && !DATASET.selected.length) return;
+
+  const ws=state.workspaces[state.curWs], ch=ws.chats[state.curChat];
+  const sessionId = `${ws.name} — ${ch.name}`;
+
+  const userAttach = [
+    ...stagedUrls.map((u,i)=>({url:u,name:staged[i].name})),
+    ...DATASET.selected.map(ref=>({url:ref.url||'',name:ref.name||ref.key}))
+  ];
+  addMsg("user", text, {attach:userAttach});
+
+  const isVision=visionish(model);
+  if(!isVision && wantOCR && (staged.length || DATASET.selected.length)){ await runOCRPreview(); }
+
+  let tokens = [];
+  if(isVision){
+    if(staged.length){ const ups = await uploadStaged(sessionId); tokens = tokens.concat(ups.map(x=>x.token)); }
+    if(DATASET.selected.length){
+      const tok2 = await datasetSelectedToImageTokens(sessionId);
+      tokens = tokens.concat(tok2);
+    }
+  }
+
+  $("#msgBox").value="";
+  staged.forEach((_,i)=>URL.revokeObjectURL(stagedUrls[i]));
+  staged=[]; stagedUrls=[]; refreshThumbs();
+
+  const system=(ch.system||$("#sysPrompt").value||"").trim(); ch.system=system; save();
+
+  const enforced="You are a helpful assistant. Reply in English. "+(system||"");
+  const msgs=(ch.messages||[]).filter(m=>m.role==="user"||m.role==="assistant").map(m=>({role:m.role,content:m.content||"",image_tokens:[]}));
+  if(isVision && tokens.length) msgs[msgs.length-1].image_tokens=tokens;
+
+  const dedup = [...DATASET._selectedKeys];
+  const payload={ session_id: sessionId, model, system: enforced, messages: msgs, fields: selectedFields };
+  if(dedup.length) payload.dataset_keys = dedup;
+
+  $("#status").style.display="inline-flex";
+  try{
+    const r=await fetch("/api/llm/chat",{method:"POST",headers:{"content-type":"application/json"},body:JSON.stringify(payload)});
+    const js=await r.json().catch(()=>({}));
+    $("#status").style.display="none";
+    if(!r.ok||js.error){ addMsg("assistant","(error) "+(js.error||r.status)); return; }
+    const reply=js.reply||""; const extract=firstJSONBlock(reply);
+    addMsg("assistant", reply, {extract, raw:js.raw||null, model});
+  }catch{ $("#status").style.display="none"; addMsg("assistant","(network error)"); }
+}
+$("#btnSend").onclick=send;
+$("#btnClear").onclick=()=>{$("#msgBox").value="";};
+
+/* ---------------- Back button ---------------- */
+$("#btnBack").onclick=()=>{
+  try{ if (document.referrer && !document.referrer.includes("/ai_chat")) { history.back(); return; } }catch{}
+  window.location.href = "/ui";
+};
+
+/* ---------------- Boot ---------------- */
+function renderAll(){ renderTree(); renderCrumb(); renderThread(); }
+document.addEventListener("DOMContentLoaded", async()=>{
+  renderAll();
+  await reloadModels();
+  renderFieldGrid();
+});
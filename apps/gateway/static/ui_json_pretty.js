@@ -0,0 +1,11 @@
+// Pretty-prints JSON for the /ui raw viewers so large payloads don't block the page.
+self.onmessage = (e) => {
+  const { id, obj } = e.data;
+  let text;
+  try {
+    text = JSON.stringify(obj, null, 2);
+  } catch (err) {
+    text = String(err);
+  }
+  self.postMessage({ id, text });
+};
@@ -2,35 +2,95 @@
 from __future__ import annotations
 
 import base64
+import gzip
+import hashlib
 import io
 import json
 import os
 import pathlib
+import re
 import secrets
 import shutil
 import time
 import mimetypes
-from collections import deque, defaultdict
+import heapq
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache, lru_cache
+from itertools import islice
+from operator import itemgetter
+from statistics import fmean
 from typing import Any, Deque, Dict, List, Tuple, Optional
 
-from fastapi import APIRouter, Body, Depends, Response, UploadFile, File, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+import httpx
+from fastapi import APIRouter, Body, Depends, Request, Response, UploadFile, File, Form
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
 from pydantic import BaseModel
-from PIL import Image
 
-from apps.gateway.deps import get_internal_client, get_s3_store, get_av
+from apps.gateway.ai_chat import _accepted_encodings
+from apps.gateway.deps import get_http_transport, get_internal_client, get_s3_store, get_av
 from packages.clients.internal_api.client import InternalAPIClient, InternalAPIError
 from packages.storage.s3_store import S3Store
 from packages.shared.av import AVScanner
 
+try:
+    import pybase64 as _b64  # type: ignore
+except Exception:  # pragma: no cover
+    _b64 = base64  # type: ignore
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import brotli  # type: ignore
+except Exception:  # pragma: no cover
+    brotli = None  # type: ignore
+
+def _loads(data: bytes | str) -> Any:
+    # bytes straight from read_bytes()/urlopen; no decode to str first
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _dumps_bytes(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj).encode("utf-8")
+
+_GZIP_MIN_BYTES = 1024  # below this the gzip header eats most of the saving
+
+def _json_response(request: Request, obj: Any) -> Response:
+    """JSON body for the dashboard's polled endpoints, gzip'd (level 1: cheap, still ~3x) when accepted."""
+    body = _dumps_bytes(obj)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= _GZIP_MIN_BYTES and "gzip" in _accepted_encodings(request.headers.get("accept-encoding")):
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, headers=headers, media_type="application/json")
+
 # ------------------------------- globals ------------------------------------ #
 
 router = APIRouter(tags=["ui", "dataset", "ocr", "ai", "metrics", "config", "live"])
 STATE_ROOT = pathlib.Path("./_state")
 SESSION_ROOT = pathlib.Path("./_sessions")
 
-# live API event ring buffer
-API_EVENTS: Deque[Dict[str, Any]] = deque(maxlen=500)  # bumped to 500
+# live API event ring buffer, one deque per field (newest first); _EV_LOCK keeps the rows aligned
+API_EVENTS_MAX = 500
+EV_TS: Deque[int] = deque(maxlen=API_EVENTS_MAX)
+EV_KIND: Deque[str] = deque(maxlen=API_EVENTS_MAX)
+EV_STATUS: Deque[int] = deque(maxlen=API_EVENTS_MAX)
+EV_MS: Deque[float] = deque(maxlen=API_EVENTS_MAX)
+EV_META: Deque[Dict[str, Any]] = deque(maxlen=API_EVENTS_MAX)
+_EV_COLUMNS = (EV_TS, EV_KIND, EV_STATUS, EV_MS, EV_META)
+_EV_LOCK = threading.Lock()
+# running aggregates over the same window, updated per event so /api/live/summary never rescans
+_EV_BY_KIND: Counter = Counter()
+_EV_BY_STATUS: Counter = Counter()
+_EV_LAT_BY_KIND: Dict[str, Deque[float]] = {}  # newest first, like the columns
+_EV_ERR_TS: Deque[int] = deque()
 
 # --------------------------------------------------------------------------- #
 # State & config helpers
@@ -39,8 +99,13 @@ API_EVENTS: Deque[Dict[str, Any]] = deque(maxlen=500)  # bumped to 500
 def _now_ts() -> float:
     return time.time()
 
+_MKDIR_DONE: set[str] = set()  # dirs this process already created; nothing here removes them
+
 def _ensure_dir(p: pathlib.Path) -> pathlib.Path:
-    p.mkdir(parents=True, exist_ok=True)
+    key = str(p)
+    if key not in _MKDIR_DONE:
+        p.mkdir(parents=True, exist_ok=True)
+        _MKDIR_DONE.add(key)
     return p
 
 def _state_file(name: str) -> pathlib.Path:
@@ -49,14 +114,31 @@ def _state_file(name: str) -> pathlib.Path:
 def _config_path() -> pathlib.Path:
     return _state_file("config.json")
 
+# parsed config.json keyed by (mtime_ns, size): steady-state loads cost one stat()
+_CFG_CACHE: Optional[Tuple[int, int, Dict[str, Any]]] = None
+
 def _load_user_config() -> Dict[str, Any]:
+    global _CFG_CACHE
+    path = STATE_ROOT / "config.json"  # no mkdir on the read path
     try:
-        return json.loads(_config_path().read_text(encoding="utf-8"))
+        st = os.stat(path)
+    except OSError:
+        return {}
+    c = _CFG_CACHE
+    if c and c[0] == st.st_mtime_ns and c[1] == st.st_size:
+        return c[2]
+    try:
+        cfg = _loads(path.read_bytes())
     except Exception:
         return {}
+    _CFG_CACHE = (st.st_mtime_ns, st.st_size, cfg)
+    return cfg
 
 def _save_user_config(cfg: Dict[str, Any]) -> None:
+    global _CFG_CACHE
     _config_path().write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    # a same-size rewrite within one mtime tick would still match the old (mtime, size) key
+    _CFG_CACHE = None
 
 def _get_effective_config() -> Dict[str, Any]:
     """
@@ -98,53 +180,116 @@ def _safe_json(obj: Any) -> str:
     except Exception:
         return "{}"
 
+# dataset ids: the same few thousand paths are re-encoded on every /api/dataset poll
+@lru_cache(maxsize=4096)
 def _b64url(s: str) -> str:
-    return base64.urlsafe_b64encode(s.encode("utf-8")).decode("ascii")
+    return _b64.urlsafe_b64encode(s.encode("utf-8")).decode("ascii")
 
+@lru_cache(maxsize=4096)
 def _b64url_dec(s: str) -> str:
-    return base64.urlsafe_b64decode(s.encode("ascii")).decode("utf-8")
+    return _b64.urlsafe_b64decode(s).decode("utf-8")
+
+_SID_UNSAFE = re.compile(r"[^\w-]+")  # same set as isalnum() plus "-" and "_"
 
+@lru_cache(maxsize=1024)
 def _session_dir(session_id: str) -> pathlib.Path:
-    sid = "".join(c for c in session_id if c.isalnum() or c in ("-", "_"))[:64] or "default"
+    # cached: the sanitising scan and the mkdir happen once per session id per process
+    sid = _SID_UNSAFE.sub("", session_id)[:64] or "default"
     return _ensure_dir(SESSION_ROOT / sid)
 
 def _upload_dir(session_id: str) -> pathlib.Path:
     return _ensure_dir(_session_dir(session_id) / "uploads")
 
+# what chat uploads almost always are; fixed so it doesn't depend on the host's /etc/mime.types
+_MIME = {
+    ".pdf": "application/pdf",
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".json": "application/json",
+    ".txt": "text/plain",
+}
+
 def _guess_mime(path: pathlib.Path) -> str:
-    return mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    mime = _MIME.get(path.suffix.lower())
+    if mime is None:  # anything else a user uploaded
+        mime = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    return mime
 
 def _record_api_event(kind: str, status: int, ms: float, meta: Dict[str, Any] | None = None):
-    API_EVENTS.appendleft({
-        "ts": int(_now_ts()),
-        "kind": kind,
-        "status": status,
-        "ms": round(ms, 1),
-        "meta": meta or {},
-    })
+    # integer clock, no float timestamp; ms is stored raw and rounded when read
+    ts = time.time_ns() // 1_000_000_000
+    status = int(status)
+    with _EV_LOCK:
+        if len(EV_TS) == API_EVENTS_MAX:
+            # the oldest row is about to fall off; it is also the oldest of its kind / errors
+            _ev_forget(EV_KIND[-1], EV_STATUS[-1])
+        EV_TS.appendleft(ts)
+        EV_KIND.appendleft(kind)
+        EV_STATUS.appendleft(status)
+        EV_MS.appendleft(ms)
+        EV_META.appendleft(meta or {})
+        _EV_BY_KIND[kind] += 1
+        _EV_BY_STATUS[status] += 1
+        _EV_LAT_BY_KIND.setdefault(kind, deque()).appendleft(ms)
+        if status >= 400:
+            _EV_ERR_TS.appendleft(ts)
+
+def _ev_forget(kind: str, status: int) -> None:
+    # caller holds _EV_LOCK
+    for counter, key in ((_EV_BY_KIND, kind), (_EV_BY_STATUS, status)):
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
+    lat = _EV_LAT_BY_KIND[kind]
+    lat.pop()
+    if not lat:
+        del _EV_LAT_BY_KIND[kind]
+    if status >= 400:
+        _EV_ERR_TS.pop()
+
+def _api_events(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Events as row dicts (the /api/live shape), newest first."""
+    with _EV_LOCK:
+        rows = list(islice(zip(*_EV_COLUMNS), limit))
+    return [{"ts": t, "kind": k, "status": s, "ms": round(ms, 1), "meta": m} for t, k, s, ms, m in rows]
+
+def _clear_api_events() -> None:
+    with _EV_LOCK:
+        for col in _EV_COLUMNS:
+            col.clear()
+        _EV_BY_KIND.clear()
+        _EV_BY_STATUS.clear()
+        _EV_LAT_BY_KIND.clear()
+        _EV_ERR_TS.clear()
+
+@cache
+def _pil():
+    # PIL.Image costs ~13ms to import; only preview/collect/ocr need it
+    from PIL import Image
+    return Image
+
+@cache
+def _http_client() -> httpx.Client:
+    # keep-alive pool shared with the engine / internal client; the dashboard polls Ollama
+    return httpx.Client(transport=get_http_transport(), follow_redirects=True)
 
-# poor-man HTTP (no extra deps)
 def _http_json(method: str, url: str, payload: Optional[dict] = None, timeout: float = 90.0) -> dict:
-    import urllib.request, urllib.error
     data = None
     headers = {"content-type": "application/json"}
     if payload is not None:
-        data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(url, data=data, headers=headers, method=method.upper())
+        data = _dumps_bytes(payload)
     t0 = time.time()
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as r:
-            b = r.read()
-            out = json.loads(b.decode("utf-8")) if b else {}
-            _record_api_event("ollama:"+method, r.status, (time.time()-t0)*1000, {"url": url})
-            return out
-    except urllib.error.HTTPError as e:
-        try:
-            err = e.read().decode("utf-8")
-        except Exception:
-            err = str(e)
-        _record_api_event("ollama:"+method, int(getattr(e, "code", 500)), (time.time()-t0)*1000, {"url": url})
-        return {"error": err, "status": getattr(e, "code", 500)}
+        r = _http_client().request(method.upper(), url, content=data, headers=headers, timeout=timeout)
+        if r.status_code >= 400:
+            _record_api_event("ollama:"+method, r.status_code, (time.time()-t0)*1000, {"url": url})
+            return {"error": r.text, "status": r.status_code}
+        b = r.content
+        out = _loads(b) if b else {}
+        _record_api_event("ollama:"+method, r.status_code, (time.time()-t0)*1000, {"url": url})
+        return out
     except Exception as e:
         _record_api_event("ollama:"+method, 599, (time.time()-t0)*1000, {"url": url})
         return {"error": str(e)}
@@ -153,108 +298,229 @@ def _http_json(method: str, url: str, payload: Optional[dict] = None, timeout: f
 # Derived metrics & summaries
 # --------------------------------------------------------------------------- #
 
-def _percentile(values: List[float], p: float) -> Optional[float]:
+def _percentile(values: List[float], p: float, presorted: bool = False) -> Optional[float]:
     if not values:
         return None
-    values = sorted(values)
+    if not presorted:
+        values = sorted(values)
     k = int(round((len(values)-1) * p))
     return float(values[k])
 
-def _scan_items_under(root: pathlib.Path) -> List[Dict[str, Any]]:
-    items: List[Dict[str, Any]] = []
-    if not root.exists():
-        return items
-    for meta_path in root.rglob("meta.json"):
-        try:
-            rel = meta_path.parent.relative_to(root)
-            name = rel.name
-            if not name.startswith("file_"): continue
-            _, rest = name.split("file_", 1)
-            file_id_str, file_hash = rest.split("_", 1)
-            file_id = int(file_id_str)
-            kod_folder = rel.parent.name
-            if not kod_folder.startswith("kod_"): continue
-            kod = int(kod_folder.split("_", 1)[1])
-            item_id = _b64url(str(rel))
-            items.append({"id": item_id, "kod": kod, "fileId": file_id, "fileHash": file_hash})
-        except Exception:
-            continue
-    items.sort(key=lambda x: (x["kod"], x["fileId"]))
-    return items
+def _scandir_meta(path: str, rel: str, parent: str):
+    """Yield (meta_path, rel, dir_name, parent_name, meta_stat) for each file_*/ dir holding a meta.json.
+
+    Plain os.scandir: DirEntry.is_dir comes from readdir, and paths are built as strings.
+    The meta.json stat doubles as the existence check and the _read_meta cache key.
+    """
+    try:
+        it = os.scandir(path)
+    except OSError:
+        return
+    with it:
+        for e in it:
+            if not e.is_dir(follow_symlinks=False):
+                continue
+            name = e.name
+            r = f"{rel}/{name}" if rel else name
+            if name.startswith("file_"):
+                mp = e.path + "/meta.json"
+                try:
+                    st = os.stat(mp)
+                except OSError:
+                    continue
+                yield mp, r, name, parent, st
+            else:
+                yield from _scandir_meta(e.path, r, name)
+
+_ITEM_DIR = re.compile(r"file_(\d+)_(.*)", re.S).fullmatch
+_KOD_DIR = re.compile(r"kod_(\d+)").fullmatch
+
+def _parse_item_dir(name: str, kod_folder: str) -> Optional[Tuple[int, int, str]]:
+    """(kod, fileId, fileHash) from a kod_<kod>/file_<id>_<hash> pair, or None."""
+    m = _ITEM_DIR(name)
+    k = _KOD_DIR(kod_folder)
+    if m is None or k is None:
+        return None
+    return int(k.group(1)), int(m.group(1)), m.group(2)
+
+_KOD_FILE = itemgetter(0, 1)
+
+def _scan_items_under(root: pathlib.Path, rel: str = "") -> List[Dict[str, Any]]:
+    """Dataset items below `root`; `rel` is root's path inside the dataset dir, so ids stay dataset-relative."""
+    # sort plain tuples (C-level comparisons) and build the dicts once, already in order
+    rows: List[Tuple[int, int, str, str]] = []
+    append, parse = rows.append, _parse_item_dir  # loop-local lookups
+    for _, r, name, kod_folder, _ in _scandir_meta(str(root), rel, root.name):
+        parsed = parse(name, kod_folder)
+        if parsed is not None:
+            append((*parsed, r))
+    rows.sort(key=_KOD_FILE)
+    b64 = _b64url
+    return [{"id": b64(r), "kod": kod, "fileId": file_id, "fileHash": file_hash}
+            for kod, file_id, file_hash, r in rows]
+
+# parsed meta.json by path, reused while (mtime_ns, size) is unchanged
+_META_CACHE: "OrderedDict[str, Tuple[int, int, Dict[str, Any]]]" = OrderedDict()
+_META_CACHE_MAX = 4096
+
+def _meta_hit(path: str, st: os.stat_result) -> Optional[Dict[str, Any]]:
+    hit = _META_CACHE.get(path)
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        _META_CACHE.move_to_end(path)
+        return hit[2]
+    return None
+
+def _meta_put(path: str, st: os.stat_result, blob: Optional[bytes]) -> Dict[str, Any]:
+    try:
+        js = _loads(blob)  # type: ignore[arg-type]
+    except Exception:
+        return {}
+    _META_CACHE[path] = (st.st_mtime_ns, st.st_size, js)
+    if len(_META_CACHE) > _META_CACHE_MAX:
+        _META_CACHE.popitem(last=False)
+    return js
+
+def _read_bytes(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _read_meta(path: str, st: Optional[os.stat_result] = None) -> Dict[str, Any]:
+    try:
+        st = st or os.stat(path)
+    except OSError:
+        return {}
+    hit = _meta_hit(path, st)
+    if hit is not None:
+        return hit
+    return _meta_put(path, st, _read_bytes(path))
+
+# cache misses are read in parallel (the GIL is released around read()); the pool is reused
+# across polls and kept small so a cold scan can't run the process out of file handles
+META_READ_WORKERS = int(os.getenv("META_READ_WORKERS", "8"))
+
+@cache
+def _meta_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=META_READ_WORKERS, thread_name_prefix="meta")
+
+def _prefetch_meta(rows: List[Tuple[str, os.stat_result]]) -> None:
+    missing = [(p, st) for p, st in rows if _meta_hit(p, st) is None]
+    if len(missing) < 8:
+        return  # not worth the hand-off; _read_meta picks them up inline
+    blobs = _meta_pool().map(_read_bytes, [p for p, _ in missing])
+    for (p, st), blob in zip(missing, blobs):
+        _meta_put(p, st, blob)
+
+# /api/dataset/summary is polled by the dashboard; recompute only when something changed
+# (collect bumps _DS_GEN; the TTL covers files written by other processes)
+_DS_GEN = 0
+_DS_SUMMARY_TTL = float(os.getenv("DS_SUMMARY_TTL", "10"))
+_DS_CACHE: Dict[str, Tuple[Tuple[int, int], float, Dict[str, Any]]] = {}
+
+def _bump_dataset_gen() -> None:
+    global _DS_GEN
+    _DS_GEN += 1
 
 def _dataset_summary(s3: S3Store) -> Dict[str, Any]:
     root = _dataset_root(s3) / "dataset"
-    items = _scan_items_under(root)
+    try:
+        key = (_DS_GEN, os.stat(root).st_mtime_ns)
+    except OSError:
+        key = (_DS_GEN, 0)
+    hit = _DS_CACHE.get(str(root))
+    if hit and hit[0] == key and _now_ts() - hit[1] < _DS_SUMMARY_TTL:
+        return hit[2]
+    out = _compute_dataset_summary(root)
+    _DS_CACHE[str(root)] = (key, _now_ts(), out)
+    return out
+
+# /api/dataset and /api/dataset/by-expense listings, same invalidation as the summary
+_DS_ITEMS_CACHE: "OrderedDict[Tuple[str, str], Tuple[Tuple[int, int], float, List[Dict[str, Any]]]]" = OrderedDict()
+_DS_ITEMS_CACHE_MAX = 256
+
+def _dataset_items(root: pathlib.Path, rel: str = "") -> List[Dict[str, Any]]:
+    """_scan_items_under(root, rel), reused until collect() runs, root's mtime moves or the TTL lapses."""
+    try:
+        key = (_DS_GEN, os.stat(root).st_mtime_ns)
+    except OSError:
+        key = (_DS_GEN, 0)
+    ck = (str(root), rel)
+    hit = _DS_ITEMS_CACHE.get(ck)
+    if hit and hit[0] == key and _now_ts() - hit[1] < _DS_SUMMARY_TTL:
+        _DS_ITEMS_CACHE.move_to_end(ck)
+        return hit[2]
+    items = _scan_items_under(root, rel)
+    _DS_ITEMS_CACHE[ck] = (key, _now_ts(), items)
+    _DS_ITEMS_CACHE.move_to_end(ck)
+    if len(_DS_ITEMS_CACHE) > _DS_ITEMS_CACHE_MAX:
+        _DS_ITEMS_CACHE.popitem(last=False)
+    return items
+
+def _compute_dataset_summary(root: pathlib.Path) -> Dict[str, Any]:
+    # one walk; meta.json is read (or served from _META_CACHE) with the stat taken during the scan
+    rows = []
+    for meta_path, _, name, kod_folder, st in _scandir_meta(str(root), "", root.name):
+        parsed = _parse_item_dir(name, kod_folder)
+        if parsed is not None:
+            rows.append((meta_path, st, parsed[0], parsed[1]))
+    _prefetch_meta([(p, st) for p, st, _, _ in rows])
     total_bytes = 0
     uniq_kod = set()
     last_ts = 0
-    latest: List[Dict[str, Any]] = []
-    for it in items:
-        meta_path = root / pathlib.Path(_b64url_dec(it["id"])) / "meta.json"
-        try:
-            js = json.loads(meta_path.read_text(encoding="utf-8"))
-        except Exception:
-            js = {}
+    latest: List[Tuple[int, int, int, int]] = []  # (-ts, kod, fileId, size): natural order is newest first
+    for meta_path, st, kod, file_id in rows:
+        js = _read_meta(meta_path, st)
         size = int(js.get("size_bytes") or 0)
         ts = int(js.get("ts") or 0)
         total_bytes += size
-        uniq_kod.add(it["kod"])
+        uniq_kod.add(kod)
         if ts > last_ts:
             last_ts = ts
-        latest.append({"kod": it["kod"], "fileId": it["fileId"], "size_bytes": size, "ts": ts})
-    latest.sort(key=lambda x: x.get("ts") or 0, reverse=True)
+        latest.append((-ts, kod, file_id, size))
     return {
-        "count": len(items),
+        "count": len(rows),
         "bytes": total_bytes,
         "unique_kods": len(uniq_kod),
         "last_ts": last_ts,
-        "latest": latest[:8],
+        "latest": [{"kod": kod, "fileId": file_id, "size_bytes": size, "ts": -neg_ts}
+                   for neg_ts, kod, file_id, size in heapq.nsmallest(8, latest)],
     }
 
 def _live_summary() -> Dict[str, Any]:
-    evs = list(API_EVENTS)
-    total = len(evs)
-    by_kind: Dict[str, int] = defaultdict(int)
-    by_status: Dict[str, int] = defaultdict(int)
-    lat_all: List[float] = []
-    lat_by_kind: Dict[str, List[float]] = defaultdict(list)
-    last_error_ts = 0
-    for e in evs:
-        k = str(e.get("kind") or "")
-        s = str(e.get("status") or "")
-        ms = float(e.get("ms") or 0.0)
-        by_kind[k] += 1
-        by_status[s] += 1
-        lat_all.append(ms)
-        lat_by_kind[k].append(ms)
-        st = int(e.get("status") or 0)
-        if st >= 400:
-            last_error_ts = max(last_error_ts, int(e.get("ts") or 0))
+    with _EV_LOCK:
+        total = len(EV_TS)
+        by_kind = dict(_EV_BY_KIND)
+        by_status = {str(s or ""): n for s, n in _EV_BY_STATUS.items()}
+        lat_all = list(EV_MS)
+        lat_by_kind = {k: list(v) for k, v in _EV_LAT_BY_KIND.items()}
+        err_count = len(_EV_ERR_TS)
+        err_last = max(_EV_ERR_TS, default=0)
     def lat_stats(vals: List[float]) -> Dict[str, Optional[float]]:
         if not vals: return {"avg": None, "p50": None, "p95": None}
+        vals = sorted(vals)  # once for both percentiles
         return {
-            "avg": round(sum(vals)/len(vals), 1),
-            "p50": _percentile(vals, 0.50),
-            "p95": _percentile(vals, 0.95),
+            "avg": round(fmean(vals), 1),
+            "p50": round(_percentile(vals, 0.50, presorted=True), 1),
+            "p95": round(_percentile(vals, 0.95, presorted=True), 1),
         }
     per_kind = {k: lat_stats(v) for k, v in lat_by_kind.items()}
     overall = lat_stats(lat_all)
     return {
         "total": total,
-        "last_5": evs[:5],
+        "last_5": _api_events(5),
         "by_kind": by_kind,
         "by_status": by_status,
         "latency": {"overall": overall, "per_kind": per_kind},
-        "errors": {"count": sum(1 for e in evs if int(e.get("status") or 0) >= 400), "last_ts": last_error_ts},
+        "errors": {"count": err_count, "last_ts": err_last},
     }
 
 # --------------------------------------------------------------------------- #
 # HTML — modernized app shell + rich dashboard
 # --------------------------------------------------------------------------- #
 
-@router.get("/ui", response_class=HTMLResponse)
-def ui() -> str:
-    return r"""
+_UI_HTML = r"""
 <!doctype html>
 <html>
 <head>
@@ -316,6 +582,8 @@ def ui() -> str:
   .chip.warn{background:#fff4d6;color:#8a6d1e}
   .toolbar{display:flex;gap:8px;align-items:center;justify-content:space-between}
   .toolbar .left,.toolbar .right{display:flex;gap:8px;align-items:center}
+  .vscroll{max-height:70vh;overflow:auto}
+  .table tr.vpad td{padding:0;border:0;background:transparent}
   details.disc{background:#f8fafc;border:1px dashed var(--line);border-radius:10px;padding:8px 10px}
   details.disc>summary{cursor:pointer;font-weight:600;font-size:12px;color:#334155}
   pre.json{margin:0;padding:12px;background:var(--dark);color:#d7e3ff;border-radius:10px;height:420px;overflow:auto;font:12px ui-monospace,Menlo,Consolas,monospace}
@@ -520,10 +788,12 @@ def ui() -> str:
           <h3>Expenses <span id="expCount" class="muted"></span></h3>
           <div class="pad">
             <input id="expSearch" class="search" placeholder="Search in description / department / KOD…">
-            <table class="table" id="tblExpenses" style="margin-top:8px">
+            <div class="vscroll" style="margin-top:8px">
+            <table class="table" id="tblExpenses">
               <thead><tr><th>KOD</th><th>AÇIKLAMA</th><th>BÖLÜM</th><th>HASH</th></tr></thead>
               <tbody></tbody>
             </table>
+            </div>
             <details class="disc" style="margin-top:8px"><summary>Last expense raw</summary><pre class="json" id="lastExpenseRaw">{}</pre></details>
           </div>
         </div>
@@ -544,7 +814,7 @@ def ui() -> str:
               <tbody><tr><td colspan="6">No files</td></tr></tbody>
             </table>
           </div>
-          <div class="pad" id="paneJSON" style="display:none">
+          <div class="pad lazyPane" id="paneJSON" style="display:none">
             <pre class="json" id="jsonView">{}</pre>
           </div>
         </div>
@@ -718,10 +988,12 @@ def ui() -> str:
       </div>
       <div class="card" style="margin-top:10px">
         <div class="pad">
+          <div class="vscroll">
           <table class="table" id="liveTable">
             <thead><tr><th>Time</th><th>Kind</th><th>Status</th><th class="right">Latency (ms)</th><th>Meta</th></tr></thead>
             <tbody></tbody>
           </table>
+          </div>
           <details class="disc" style="margin-top:10px">
             <summary>Raw JSON</summary>
             <pre class="json" id="liveJSON">{}</pre>
@@ -776,6 +1048,49 @@ def ui() -> str:
 const $  = (s)=>document.querySelector(s);
 const $$ = (s)=>Array.from(document.querySelectorAll(s));
 const sleep=(ms)=>new Promise(r=>setTimeout(r,ms));
+// element builder: props are assigned onto the node (className, textContent, onclick, …);
+// string children become text nodes, so API / model values are never parsed as HTML
+function dom(tag, props, ...kids){
+  const node=document.createElement(tag);
+  if(props) Object.assign(node, props);
+  node.append(...kids.filter(k=>k!==null && k!==undefined && k!==false));
+  return node;
+}
+function statusChip(st){
+  return dom("span",{className:"chip "+(st>=200 && st<300 ? "ok" : (st>=400?"err":"warn"))}, String(st));
+}
+function jsonDetails(label, obj, props){
+  const pre=dom("pre",{className:"json"});
+  const det=dom("details",{className:"disc", ...props}, dom("summary",null,label), pre);
+  showJSON(pre, obj);  // collapsed, so it is only stringified once opened
+  return det;
+}
+function modelRow(m){
+  return dom("tr",null,
+    dom("td",null,String(m.name??"")),
+    dom("td",null,m.details?.family||"—"),
+    dom("td",{className:"right"},fmtBytes(m.size||m.details?.size||0)),
+    dom("td",null,jsonDetails("view", m.details||{})));
+}
+
+// relative URL with an encoded query; null/undefined params are left out
+function qs(path, params){
+  const q=new URLSearchParams();
+  for(const k in params){ if(params[k]!=null) q.set(k, params[k]); }
+  const s=q.toString();
+  return s ? path+"?"+s : path;
+}
+
+// leading-edge throttle for manual buttons: repeat clicks within `ms` are ignored
+function throttle(fn, ms=2000){
+  let last=0;
+  return (...args)=>{ const now=Date.now(); if(now-last<ms) return; last=now; return fn(...args); };
+}
+// trailing-edge debounce for typing: only the last call of a burst runs, `ms` after it
+function debounce(fn, ms=120){
+  let t=0;
+  return (...args)=>{ clearTimeout(t); t=setTimeout(()=>fn(...args), ms); };
+}
 
 function fmtBytes(n){
   try{
@@ -790,27 +1105,168 @@ function humanTime(ts){
   try{ const d=new Date(ts*1000); return d.toLocaleString(); }catch(_){ return String(ts) }
 }
 
+/* windowed tbody: long lists only keep the rows around the viewport of their .vscroll
+   parent in the DOM; spacer rows stand in for the rest so the scrollbar stays right.
+   Rows differ in height (wrapped descriptions, an opened meta <details>), so each painted
+   row is measured and remembered; rows not seen yet count as the last window's average.
+   Row elements are kept per record, so re-painting reuses them and keeps their state. */
+const VROWS_MIN=200, VROWS_OVERSCAN=15, VROW_SPACING=8;  // border-spacing between rows
+function virtualRows(tb, rows, makeRow){
+  const wrap=tb.closest(".vscroll");
+  tb._els ||= new WeakMap();  // record -> <tr>
+  tb._hts ||= new WeakMap();  // record -> measured height incl. spacing
+  tb._v={rows, makeRow, first:-1, last:-1};
+  if(wrap && !wrap._vbound){
+    wrap._vbound=true;
+    let queued=false;
+    wrap.addEventListener("scroll",()=>{
+      if(queued) return; queued=true;
+      requestAnimationFrame(()=>{ queued=false; paintRows(tb); });
+    },{passive:true});
+    // an opened/closed <details> changes its row's height; toggle doesn't bubble
+    tb.addEventListener("toggle",(e)=>{
+      const tr=e.target.closest("tr"), r=tr && tr._vrec;
+      const h=tr && tr.getBoundingClientRect().height;
+      if(r && h) tb._hts.set(r, h+VROW_SPACING);
+    }, true);
+  }
+  if(wrap) wrap.scrollTop=0;
+  paintRows(tb);
+}
+function rowEl(tb, r){
+  let tr=tb._els.get(r);
+  if(!tr){ tr=tb._v.makeRow(r); tr._vrec=r; tb._els.set(r, tr); }
+  return tr;
+}
+function paintRows(tb){
+  const v=tb._v, rows=v.rows, wrap=tb.closest(".vscroll"), hts=tb._hts;
+  const frag=document.createDocumentFragment();
+  if(!wrap || rows.length<=VROWS_MIN){
+    rows.forEach(r=>frag.appendChild(rowEl(tb, r)));
+    tb.replaceChildren(frag); return;
+  }
+  const est=tb._est||48, n=rows.length;
+  const top=wrap.scrollTop, bottom=top+wrap.clientHeight;
+  // first row reaching into the viewport, then the last one, from the known heights
+  let y=0, i=0;
+  for(; i<n; i++){ const h=hts.get(rows[i])||est; if(y+h>top) break; y+=h; }
+  let j=i;
+  for(; j<n && y<bottom; j++) y+=hts.get(rows[j])||est;
+  const first=Math.max(0, i-VROWS_OVERSCAN), last=Math.min(n, j+VROWS_OVERSCAN);
+  if(first===v.first && last===v.last) return;
+  let padTop=0, padBottom=0;
+  for(let k=0;k<first;k++) padTop+=hts.get(rows[k])||est;
+  for(let k=last;k<n;k++) padBottom+=hts.get(rows[k])||est;
+  const cols=tb.closest("table").tHead?.rows[0]?.cells.length||1;
+  const spacer=(px)=>{
+    const tr=document.createElement("tr"); tr.className="vpad";
+    tr.innerHTML=`<td colspan="${cols}" style="height:${Math.max(0, px-VROW_SPACING)}px"></td>`;
+    return tr;
+  };
+  if(first>0) frag.appendChild(spacer(padTop));
+  for(let k=first;k<last;k++) frag.appendChild(rowEl(tb, rows[k]));
+  if(last<n) frag.appendChild(spacer(padBottom));
+  tb.replaceChildren(frag);
+  v.first=first; v.last=last;
+  // one layout for the whole window: all reads come after the single write above
+  let sum=0, cnt=0;
+  for(let k=first;k<last;k++){
+    const h=tb._els.get(rows[k]).getBoundingClientRect().height;  // 0 while the tab is hidden
+    if(!h) break;
+    const H=h+VROW_SPACING;
+    if(hts.get(rows[k])!==H){ hts.set(rows[k], H); v.last=-1; }  // spacers were estimated: redo on next scroll
+    sum+=H; cnt++;
+  }
+  if(cnt) tb._est=sum/cnt;
+}
+
+/* raw JSON viewers: indenting a big payload can stall the page, so anything past a
+   small node budget is stringified in a worker; late replies for a viewer are dropped */
+const PRETTY_WORKER_URL="__PRETTY_WORKER_URL__", PRETTY_INLINE_NODES=150;
+let prettyWorker, prettySeq=0;
+const prettyWaiting=new Map();
+function isSmallJSON(v, budget={n:PRETTY_INLINE_NODES}){
+  if(v===null || typeof v!=="object") return true;
+  for(const k in v){ if(--budget.n<0 || !isSmallJSON(v[k], budget)) return false; }
+  return true;
+}
+function prettyFallback(){
+  prettyWorker=null;
+  prettyWaiting.forEach(({el, obj}, id)=>{ if(el._prettyId===id) el.textContent=JSON.stringify(obj,null,2); });
+  prettyWaiting.clear();
+}
+function showJSON(el, obj){
+  if(!el || el._jsonObj===obj) return;  // same object again, e.g. a jgetCached hit
+  el._jsonObj=obj;
+  // collapsed <details> or a hidden .lazyPane: nothing to look at yet, render when shown
+  const box=el.closest("details,.lazyPane");
+  if(box && (box.tagName==="DETAILS" ? !box.open : box.style.display==="none")){
+    el._jsonDirty=true;
+    if(box.tagName==="DETAILS" && !box._lazyJSON){
+      box._lazyJSON=true;
+      box.addEventListener("toggle",()=>{ if(box.open) flushJSON(box); });
+    }
+    return;
+  }
+  renderJSON(el, obj);
+}
+function flushJSON(box){
+  box.querySelectorAll("pre").forEach(pre=>{ if(pre._jsonDirty) renderJSON(pre, pre._jsonObj); });
+}
+function renderJSON(el, obj){
+  el._jsonDirty=false;
+  const id=++prettySeq; el._prettyId=id;
+  if(prettyWorker===undefined){
+    try{
+      prettyWorker=new Worker(PRETTY_WORKER_URL);
+      prettyWorker.onmessage=(e)=>{
+        const w=prettyWaiting.get(e.data.id); prettyWaiting.delete(e.data.id);
+        if(w && w.el._prettyId===e.data.id && w.el.textContent!==e.data.text) w.el.textContent=e.data.text;
+      };
+      prettyWorker.onerror=prettyFallback;
+    }catch(_){ prettyWorker=null; }
+  }
+  if(!prettyWorker || isSmallJSON(obj)){
+    const text=JSON.stringify(obj,null,2);
+    if(el.textContent!==text) el.textContent=text;  // identical payloads leave the DOM alone
+    return;
+  }
+  prettyWaiting.set(id, {el, obj});
+  try{ prettyWorker.postMessage({id, obj}); }
+  catch(_){ prettyWaiting.delete(id); el.textContent=JSON.stringify(obj,null,2); }  // not cloneable
+}
+
 /* JSON helpers: structured KV + raw viewer */
 function renderKV(el, obj, path=[]){
-  el.innerHTML="";
-  const kv=document.createElement("div"); kv.className="kv";
-  function row(k,v){
-    const dk=document.createElement("div"); dk.className="k"; dk.textContent=path.concat([k]).join(".");
-    const dv=document.createElement("div");
-    dv.innerHTML = (typeof v==="object" && v!==null)
-      ? `<code class="mono">${Array.isArray(v)?"[Array]":"{Object}"}</code>`
-      : `<code class="mono">${String(v)}</code>`;
-    kv.appendChild(dk); kv.appendChild(dv);
-  }
-  try{
-    Object.entries(obj||{}).forEach(([k,v])=>{
+  if(el._kvObj===obj) return;  // same object again, e.g. a jgetCached hit
+  el._kvObj=obj;
+  const pairs=[], base=path.length ? path.join(".")+"." : "";
+  // one pass, two levels deep (deeper objects show as {Object}/[Array]); keys are built as we go
+  function walk(o, prefix, deep){
+    for(const k in o){
+      const v=o[k], p=prefix+k;
       if(typeof v==="object" && v!==null){
-        row(k,v);
-        Object.entries(v).forEach(([k2,v2])=>row(k+"."+k2,v2));
-      }else row(k,v);
-    });
-  }catch(_){}
-  el.appendChild(kv);
+        pairs.push([p, Array.isArray(v)?"[Array]":"{Object}"]);
+        if(deep) walk(v, p+".", false);
+      }else pairs.push([p, String(v)]);
+    }
+  }
+  try{ walk(obj||{}, base, true); }catch(_){}
+  // same keys in the same order as last time: only touch the values that changed
+  let keys="";
+  for(let i=0;i<pairs.length;i++) keys+=pairs[i][0]+"\n";
+  if(el._kvKeys===keys){
+    pairs.forEach(([,text],i)=>{ const c=el._kvCells[i]; if(c.textContent!==text) c.textContent=text; });
+    return;
+  }
+  const kv=dom("div",{className:"kv"}), cells=[];
+  for(const [k,text] of pairs){
+    const code=dom("code",{className:"mono"},text);
+    kv.append(dom("div",{className:"k"},k), dom("div",null,code));
+    cells.push(code);
+  }
+  el.replaceChildren(kv);
+  el._kvKeys=keys; el._kvCells=cells;
 }
 
 /* ------------------------- global state ------------------------ */
@@ -830,13 +1286,14 @@ let memHist=[]; // for sparkline
 async function dashReload(){
   try{
     const [st, mx, md, dsSum, liveSum] = await Promise.all([
-      (await fetch("/api/status")).json(),
-      (await fetch("/api/metrics")).json(),
-      (await fetch("/api/llm/models")).json(),
-      (await fetch("/api/dataset/summary")).json(),
-      (await fetch("/api/live/summary")).json(),
+      jgetCached("/api/status"),
+      jgetCached("/api/metrics"),
+      jgetCached("/api/llm/models"),
+      jget("/api/dataset/summary", navCtrl.signal),
+      jgetCached("/api/live/summary"),
     ]);
-    const dsList = await (await fetch("/api/dataset")).json();
+    // the list is only a fallback for the count tile
+    const dsList = dsSum.count!=null ? {} : await jget("/api/dataset", navCtrl.signal);
 
     // Tiles
     $("#tileUp").textContent = mx.sys?.uptime_h || "—";
@@ -848,34 +1305,28 @@ async function dashReload(){
 
     // Gateway status structured + raw
     renderKV($("#dashStatusKV"), st);
-    $("#dashStatusRaw").textContent = JSON.stringify(st,null,2);
+    showJSON($("#dashStatusRaw"), st);
 
     // Metrics structured + raw
     renderKV($("#dashMetricsKV"), mx);
-    $("#dashMetricsRaw").textContent = JSON.stringify(mx,null,2);
+    showJSON($("#dashMetricsRaw"), mx);
 
     // Models table
-    const tb=$("#dashModelsTable tbody"); tb.innerHTML="";
-    (md.models||[]).forEach(m=>{
-      const tr=document.createElement("tr");
-      tr.innerHTML = `<td>${m.name}</td><td>${m.details?.family||"—"}</td><td class="right">${fmtBytes(m.size||m.details?.size||0)}</td>
-      <td><details class="disc"><summary>view</summary><pre class="json">${JSON.stringify(m.details||{},null,2)}</pre></details></td>`;
-      tb.appendChild(tr);
-    });
-    $("#dashModelsRaw").textContent = JSON.stringify(md,null,2);
+    const tb=$("#dashModelsTable tbody"), mfrag=document.createDocumentFragment();
+    (md.models||[]).forEach(m=>mfrag.appendChild(modelRow(m)));
+    tb.replaceChildren(mfrag);
+    showJSON($("#dashModelsRaw"), md);
 
     // Recent events
-    const etb=$("#dashEvents tbody"); etb.innerHTML="";
+    const etb=$("#dashEvents tbody"), efrag=document.createDocumentFragment();
     (liveSum.last_5||[]).forEach(ev=>{
-      const stn = Number(ev.status||0);
-      const cls = stn>=200 && stn<300 ? "ok" : (stn>=400?"err":"warn");
-      const tr=document.createElement("tr");
-      tr.innerHTML = `<td class="mono">${humanTime(ev.ts||0)}</td>
-                      <td><span class="chip">${ev.kind||""}</span></td>
-                      <td><span class="chip ${cls}">${stn}</span></td>
-                      <td class="right mono">${Number(ev.ms||0).toFixed(1)}</td>`;
-      etb.appendChild(tr);
+      efrag.appendChild(dom("tr",null,
+        dom("td",{className:"mono"},humanTime(ev.ts||0)),
+        dom("td",null,dom("span",{className:"chip"},ev.kind||"")),
+        dom("td",null,statusChip(Number(ev.status||0))),
+        dom("td",{className:"right mono"},Number(ev.ms||0).toFixed(1))));
     });
+    etb.replaceChildren(efrag);
 
     // Event summary KV
     const evKV = {
@@ -889,7 +1340,7 @@ async function dashReload(){
       "by_status": liveSum.by_status,
     };
     renderKV($("#dashEventKV"), evKV);
-    $("#dashEventRaw").textContent = JSON.stringify(liveSum,null,2);
+    showJSON($("#dashEventRaw"), liveSum);
 
     // Dataset highlights
     const dkv = {
@@ -897,76 +1348,89 @@ async function dashReload(){
       "unique_kods": dsSum.unique_kods, "last_ts": dsSum.last_ts ? humanTime(dsSum.last_ts) : "—",
     };
     renderKV($("#dashDatasetKV"), dkv);
-    $("#dashDatasetRaw").textContent = JSON.stringify(dsSum.latest||[],null,2);
+    showJSON($("#dashDatasetRaw"), dsSum.latest||[]);
 
   }catch(e){
-    console.error(e);
+    if(!isAbort(e)) console.error(e);
   }
 }
 
 /* ---------------------------- chat ----------------------------- */
 function renderSessions(){
-  const sel=$("#sessionSel"); sel.innerHTML="";
+  const sel=$("#sessionSel"), frag=document.createDocumentFragment();
   Object.keys(sessions).forEach(name=>{
-    const opt=document.createElement("option"); opt.value=name; opt.textContent=name; sel.appendChild(opt);
+    const opt=document.createElement("option"); opt.value=name; opt.textContent=name; frag.appendChild(opt);
   });
+  sel.replaceChildren(frag);
   sel.value=curSession;
   $("#sysPrompt").value=sessions[curSession]?.system||"";
   renderChat();
 }
-function saveSessions(){ localStorage.setItem(SKEY, JSON.stringify(sessions)); }
+// chat history is written 400ms after the last change, when the browser is idle, and flushed
+// on pagehide; replies older than the last SESSIONS_KEEP_RAW per session are stored without
+// their raw model JSON (it stays in memory for this page)
+const SESSIONS_KEEP_RAW=20;
+let saveTimer=0, sessionsDirty=false;
+function saveSessions(){
+  sessionsDirty=true;
+  clearTimeout(saveTimer);
+  saveTimer=setTimeout(()=>(window.requestIdleCallback||setTimeout)(writeSessions), 400);
+}
+function writeSessions(){
+  if(!sessionsDirty) return;
+  sessionsDirty=false;
+  const out={};
+  for(const [name, ss] of Object.entries(sessions)){
+    const msgs=ss.messages||[], cut=msgs.length-SESSIONS_KEEP_RAW;
+    out[name]={...ss, messages: cut>0 ? msgs.map((m,i)=> i<cut && m.raw ? {...m, raw:undefined} : m) : msgs};
+  }
+  try{ localStorage.setItem(SKEY, JSON.stringify(out)); }catch(e){ console.error(e); }
+}
+window.addEventListener("pagehide", writeSessions);
 
 function renderExtractCard(ex){
-  const card=document.createElement("div"); card.className="extractCard";
   const items = Array.isArray(ex?.items)? ex.items : [];
-  const safe = (v)=> v===null||v===undefined ? "<span class='muted'>null</span>" : String(v);
-  card.innerHTML = `
-    <div class="row" style="justify-content:space-between">
-      <div class="small">Extracted fields</div>
-      <div class="row">
-        <button class="ghost" id="btnCopyJSON">Copy JSON</button>
-        <button class="ghost" id="btnDownloadJSON">Download</button>
-      </div>
-    </div>
-    <div class="extractGrid" style="margin-top:6px">
-      <div><div class="small muted">Merchant</div><div class="mono">${safe(ex.merchant)}</div></div>
-      <div><div class="small muted">Date</div><div class="mono">${safe(ex.date)}</div></div>
-      <div><div class="small muted">Currency</div><div class="mono">${safe(ex.currency)}</div></div>
-      <div><div class="small muted">Total</div><div class="mono">${safe(ex.total)}</div></div>
-    </div>
-    <div style="margin-top:8px">
-      <table class="itemsTable">
-        <thead><tr><th>Description</th><th>Qty</th><th>Unit</th><th>Line total</th></tr></thead>
-        <tbody>
-          ${items.map(it=>`<tr><td>${safe(it.description)}</td><td>${safe(it.qty)}</td><td>${safe(it.unit_price)}</td><td>${safe(it.line_total)}</td></tr>`).join("")}
-        </tbody>
-      </table>
-    </div>
-    <div class="row" style="justify-content:flex-end;margin-top:8px">
-      <button class="secondary" id="btnApply">Send corrections</button>
-    </div>
-    <details class="disc" style="margin-top:8px"><summary>Raw JSON</summary><pre class="json">${JSON.stringify(ex,null,2)}</pre></details>
-  `;
-  // wire buttons
-  card.querySelector("#btnCopyJSON").onclick=()=>copy(JSON.stringify(ex,null,2));
-  card.querySelector("#btnDownloadJSON").onclick=()=>{
-    const url = URL.createObjectURL(new Blob([JSON.stringify(ex,null,2)],{type:"application/json"}));
-    const a=document.createElement("a"); a.href=url; a.download=`extraction.json`; a.click(); URL.revokeObjectURL(url);
-  };
-  card.querySelector("#btnApply").onclick=()=>{
-    const text=`Correct the extraction to EXACTLY this JSON:\n\`\`\`json\n${JSON.stringify(ex,null,2)}\n\`\`\`\nIf any field is inconsistent with the document, explain briefly.`;
-    $("#msgBox").value=text; $("#msgBox").focus();
-  };
-  return card;
+  const val = (v)=> v===null||v===undefined ? dom("span",{className:"muted"},"null") : String(v);
+  const field = (label, v)=> dom("div",null, dom("div",{className:"small muted"},label), dom("div",{className:"mono"},val(v)));
+  const pretty = ()=>JSON.stringify(ex,null,2);
+  const rows=document.createDocumentFragment();
+  for(const it of items){
+    rows.appendChild(dom("tr",null,
+      dom("td",null,val(it.description)), dom("td",null,val(it.qty)),
+      dom("td",null,val(it.unit_price)), dom("td",null,val(it.line_total))));
+  }
+  return dom("div",{className:"extractCard"},
+    dom("div",{className:"row", style:"justify-content:space-between"},
+      dom("div",{className:"small"},"Extracted fields"),
+      dom("div",{className:"row"},
+        dom("button",{className:"ghost", onclick:()=>copy(pretty())},"Copy JSON"),
+        dom("button",{className:"ghost", onclick:()=>{
+          const url = URL.createObjectURL(new Blob([pretty()],{type:"application/json"}));
+          const a=document.createElement("a"); a.href=url; a.download=`extraction.json`; a.click(); URL.revokeObjectURL(url);
+        }},"Download"))),
+    dom("div",{className:"extractGrid", style:"margin-top:6px"},
+      field("Merchant",ex.merchant), field("Date",ex.date), field("Currency",ex.currency), field("Total",ex.total)),
+    dom("div",{style:"margin-top:8px"},
+      dom("table",{className:"itemsTable"},
+        dom("thead",null,dom("tr",null,dom("th",null,"Description"),dom("th",null,"Qty"),dom("th",null,"Unit"),dom("th",null,"Line total"))),
+        dom("tbody",null,rows))),
+    dom("div",{className:"row", style:"justify-content:flex-end;margin-top:8px"},
+      dom("button",{className:"secondary", onclick:()=>{
+        const text=`Correct the extraction to EXACTLY this JSON:\n\`\`\`json\n${pretty()}\n\`\`\`\nIf any field is inconsistent with the document, explain briefly.`;
+        $("#msgBox").value=text; $("#msgBox").focus();
+      }},"Send corrections")),
+    jsonDetails("Raw JSON", ex, {style:"margin-top:8px"}));
 }
 
 function renderChat(){
-  const box=$("#chatBox"); box.innerHTML="";
+  const box=$("#chatBox"), frag=document.createDocumentFragment();
   const msgs=(sessions[curSession]?.messages)||[];
+  let lastRaw;
   msgs.forEach(m=>{
-    const div=document.createElement("div"); div.className="bubble "+(m.role==="user"?"me":"ai");
-    const head = (m.role==="user"?"<b>You</b>":"<b>AI</b>");
-    div.innerHTML = head + (m.model?` <span class="tag mono">${m.model}</span>`:"") + "<br>" + (m.content||"").replace(/</g,"&lt;");
+    const div=dom("div",{className:"bubble "+(m.role==="user"?"me":"ai")},
+      dom("b",null,m.role==="user"?"You":"AI"),
+      m.model ? " " : null, m.model ? dom("span",{className:"tag mono"},String(m.model)) : null,
+      dom("br"), m.content||"");
     // attachments
     if(m.attach && m.attach.length){
       const a=document.createElement("div"); a.style.marginTop="8px"; a.style.display="flex"; a.style.flexWrap="wrap"; a.style.gap="6px";
@@ -984,14 +1448,14 @@ function renderChat(){
     }
     // raw model response (if available)
     if(m.raw){
-      const det=document.createElement("details"); det.className="disc"; det.style.marginTop="8px";
-      det.innerHTML=`<summary>Model raw</summary><pre class="json">${JSON.stringify(m.raw,null,2)}</pre>`;
-      div.appendChild(det);
-      $("#lastChatRaw").textContent = JSON.stringify(m.raw,null,2);
+      div.appendChild(jsonDetails("Model raw", m.raw, {style:"margin-top:8px"}));
+      lastRaw=m.raw;
     }
-    box.appendChild(div);
+    frag.appendChild(div);
   });
+  box.replaceChildren(frag);
   box.scrollTop=box.scrollHeight;
+  if(lastRaw!==undefined) showJSON($("#lastChatRaw"), lastRaw);
 }
 
 function extractFirstJSONBlock(text){
@@ -1003,23 +1467,23 @@ function extractFirstJSONBlock(text){
 }
 
 async function reloadModels(){
-  const js = await (await fetch("/api/llm/models")).json().catch(()=>({models:[]}));
-  const sel=$("#modelSel"); sel.innerHTML="";
+  const js = await jgetCached("/api/llm/models").catch(()=>({models:[]}));
+  const sel=$("#modelSel"), ofrag=document.createDocumentFragment();
   if((js.models||[]).length===0){
-    const opt=document.createElement("option"); opt.value=""; opt.textContent="No models"; sel.appendChild(opt);
+    const opt=document.createElement("option"); opt.value=""; opt.textContent="No models"; ofrag.appendChild(opt);
   }else{
     (js.models||[]).forEach(m=>{
-      const opt=document.createElement("option"); opt.value=m.name; opt.textContent=m.name; sel.appendChild(opt);
+      const opt=document.createElement("option"); opt.value=m.name; opt.textContent=m.name; ofrag.appendChild(opt);
     });
   }
+  sel.replaceChildren(ofrag);
   // Also fill models table in APIs page
-  const tb=$("#modelsTable tbody"); if(tb){ tb.innerHTML=""; (js.models||[]).forEach(m=>{
-    const tr=document.createElement("tr");
-    tr.innerHTML = `<td>${m.name}</td><td>${m.details?.family||"—"}</td><td class="right">${fmtBytes(m.size||m.details?.size||0)}</td>
-    <td><details class="disc"><summary>view</summary><pre class="json">${JSON.stringify(m.details||{},null,2)}</pre></details></td>`;
-    tb.appendChild(tr);
-  }); }
-  $("#modelsJSON").textContent = JSON.stringify(js,null,2);
+  const tb=$("#modelsTable tbody"); if(tb){
+    const tfrag=document.createDocumentFragment();
+    (js.models||[]).forEach(m=>tfrag.appendChild(modelRow(m)));
+    tb.replaceChildren(tfrag);
+  }
+  showJSON($("#modelsJSON"), js);
 }
 
 /* --------------------------- tune/dataset ---------------------- */
@@ -1029,10 +1493,32 @@ function setDates(){
   $("#start").value=start.toISOString().slice(0,10); $("#end").value=end.toISOString().slice(0,10);
 }
 
-async function jget(u){ const r=await fetch(u); if(!r.ok) throw new Error("HTTP "+r.status); return r.json(); }
+async function jget(u, signal){ const r=await fetch(u,{signal}); if(!r.ok) throw new Error("HTTP "+r.status); return r.json(); }
+
+/* view-scoped requests: router() aborts the previous view's loads, so a fast tab switch
+   doesn't keep downloading and rendering into a page that is no longer shown. The shared
+   jgetCached endpoints stay unscoped: the status bar polls them whatever the view. */
+let navCtrl=new AbortController();
+const isAbort=(e)=>e?.name==="AbortError";
+
+/* short-lived cache for the endpoints the dashboard, the status bar and the views share;
+   callers within the TTL (including concurrent ones) get the same promise */
+const JCACHE_TTL={"/api/status":2500, "/api/metrics":2500, "/api/live/summary":2000, "/api/llm/models":30000};
+const _jcache=new Map();
+function jgetCached(u, ttl=JCACHE_TTL[u]??2500){
+  const hit=_jcache.get(u), now=Date.now();
+  if(hit && now-hit.t<ttl) return hit.p;
+  const p=jget(u);
+  _jcache.set(u,{t:now, p});
+  p.catch(()=>{ if(_jcache.get(u)?.p===p) _jcache.delete(u); });  // don't keep failures around
+  return p;
+}
+function jcacheDrop(...urls){ urls.forEach(u=>_jcache.delete(u)); }
 async function jpost(u,body){ const r=await fetch(u,{method:"POST",headers:{"content-type":"application/json"},body:JSON.stringify(body)}); const js=await r.json().catch(()=>({})); if(!r.ok||js.error) throw new Error(js.error||("HTTP "+r.status)); return js; }
 
 let lastExpensesCache=[];
+// record -> lowercased search text, filled once per load so filtering is one includes() per row
+const searchKeys=new WeakMap();
 
 function renderExpenses(rowsRaw){
   const rows = Array.isArray(rowsRaw) ? rowsRaw
@@ -1040,20 +1526,31 @@ function renderExpenses(rowsRaw){
     : Array.isArray(rowsRaw?.data) ? rowsRaw.data
     : Array.isArray(Object.values(rowsRaw||{})) ? Object.values(rowsRaw||{}) : [];
   lastExpensesCache = rows.slice();
-  const tb=$("#tblExpenses tbody"); tb.innerHTML="";
+  for(const r of rows) searchKeys.set(r, [r.Kod??r.kod??r.id??"", r.Aciklama??r.aciklama??"", r.Bolum??r.bolum??""].join("\0").toLowerCase());
+  const tb=$("#tblExpenses tbody");
   if(rows.length===0){ tb.innerHTML="<tr><td colspan='4' class='muted'>No items</td></tr>"; $("#expCount").textContent="0"; return; }
-  rows.forEach(r=>{
-    const tr=document.createElement("tr");
-    const kod = r.Kod ?? r.kod ?? r.id ?? r.code ?? "";
-    const acik = r.Aciklama ?? r.aciklama ?? r.desc ?? "";
-    const bol = r.Bolum ?? r.bolum ?? r.dept ?? "";
-    const h = r.Hash ?? r.hash ?? r.h ?? "";
-    tr.innerHTML=`<td class="mono">${kod}</td><td>${acik}</td><td>${bol}</td><td class="mono">${h}</td>`;
-    tr.onclick=()=>openExpense(kod,h);
-    tb.appendChild(tr);
-  });
+  fillExpenseRows(tb, rows);
   $("#expCount").textContent=String(rows.length);
 }
+// record -> its <tr>; built once per load and reused by filtering and scrolling
+const expenseRows=new WeakMap();
+function expenseRow(r){
+  let tr=expenseRows.get(r);
+  if(tr) return tr;
+  const kod = r.Kod ?? r.kod ?? r.id ?? r.code ?? "";
+  const acik = r.Aciklama ?? r.aciklama ?? r.desc ?? "";
+  const bol = r.Bolum ?? r.bolum ?? r.dept ?? "";
+  const h = r.Hash ?? r.hash ?? r.h ?? "";
+  tr=dom("tr",null,
+    dom("td",{className:"mono"},String(kod)), dom("td",null,String(acik)),
+    dom("td",null,String(bol)), dom("td",{className:"mono"},String(h)));
+  rowData.set(tr, {kod, hash:h});
+  expenseRows.set(r, tr);
+  return tr;
+}
+function fillExpenseRows(tb, rows){
+  virtualRows(tb, rows, expenseRow);
+}
 
 async function loadExpenses(){
   $("#tblExpenses tbody").innerHTML="<tr><td colspan='4' class='muted'>Loading…</td></tr>";
@@ -1061,62 +1558,82 @@ async function loadExpenses(){
   selected.clear(); $("#tabSelected").textContent=`Selected (0)`; $("#btnAdd").disabled=true; $("#btnSelectAll").disabled=true; $("#btnBulkOCR").disabled=true; $("#btnBulkAI").disabled=true;
   const st=$("#start").value, en=$("#end").value;
   try{
-    const js=await jget(`/api/expenses?startDate=${encodeURIComponent(st)}&endDate=${encodeURIComponent(en)}`);
+    const js=await jget(qs("/api/expenses",{startDate:st, endDate:en}));
     renderExpenses(js);
   }catch(err){
     $("#tblExpenses tbody").innerHTML=`<tr><td colspan='4' class='muted'>Error: ${(err&&err.message)||err}</td></tr>`;
   }
 }
 
+// row -> the record it shows; the table bodies have one delegated listener each (wireTables)
+const rowData=new WeakMap();
+
 function renderFiles(files){
   currentFiles = files || [];
-  const tb=$("#tblFiles tbody"); tb.innerHTML="";
-  const sum = {count: files?.length||0, total: (files||[]).reduce((a,b)=>a+(b.Size||0),0)};
+  const tb=$("#tblFiles tbody"), frag=document.createDocumentFragment();
+  let total=0;
+  for(let i=0;i<currentFiles.length;i++) total+=currentFiles[i].Size||0;
+  const sum = {count: currentFiles.length, total};
   $("#filesSummary").textContent = `${sum.count} files • ${fmtBytes(sum.total)}`;
   if(!files || files.length===0){ tb.innerHTML="<tr><td colspan='6'>No files</td></tr>"; $("#btnSelectAll").disabled=true; $("#btnBulkOCR").disabled=true; $("#btnBulkAI").disabled=true; return; }
   files.forEach(f=>{
     const id=f.Kod||f.FileId||f.Id, name=f.OrjinalAdi||f.Original||"", hash=f.Hash||f.FileHash||"", typ=f.MimeType||f.FileType||"", size=f.Size||0;
-    const tr=document.createElement("tr");
-    const checked = selected.has(id) ? "checked" : "";
-    tr.innerHTML=`<td><input type="checkbox" data-id="${id}" ${checked}></td>
-      <td class="mono">${id}</td><td>${name}</td><td class="mono">${hash}</td><td class="mono">${typ}</td><td class="right">${fmtBytes(size)}</td>`;
-    tr.onclick=(e)=>{
-      if(e.target && e.target.tagName==="INPUT") return; // checkbox click
-      nextSlot = (nextSlot%4)+1;
-      $(`#pv${nextSlot}`).innerHTML=`<img src="/api/preview?kod=${encodeURIComponent(currentExpense.kod)}&fileId=${encodeURIComponent(id)}&fileHash=${encodeURIComponent(hash)}&t=${Date.now()}" alt="">`;
-      $("#btnOCR").disabled=false; $("#btnAI").disabled=false;
-      $("#btnOCR").onclick=async()=>{
-        const r=await jpost("/api/ocr",{kod:currentExpense.kod,fileId:id,fileHash:hash});
-        log(`[OCR] ${(r.text||"").slice(0,220)}${(r.text||"").length>220?"…":""}`);
-      };
-      $("#btnAI").onclick=async()=>{
-        const r=await jpost("/api/ai/extract",{kod:currentExpense.kod,fileId:id,fileHash:hash});
-        log(`[AI] ${JSON.stringify(r.fields)}`);
-      };
-    };
-    tr.querySelector("input").onchange=(e)=>{
-      if(e.target.checked){ selected.set(id, { fileId:id, fileHash:hash }); }
-      else{ selected.delete(id); }
-      $("#tabSelected").textContent=`Selected (${selected.size})`;
-      const haveSel = selected.size>0;
-      $("#btnAdd").disabled = !haveSel;
-      $("#btnBulkOCR").disabled = !haveSel;
-      $("#btnBulkAI").disabled = !haveSel;
-    };
-    tb.appendChild(tr);
+    const cb=dom("input",{type:"checkbox", checked:selected.has(id)}); cb.dataset.id=String(id);
+    const tr=dom("tr",null,
+      dom("td",null,cb), dom("td",{className:"mono"},String(id)), dom("td",null,String(name)),
+      dom("td",{className:"mono"},String(hash)), dom("td",{className:"mono"},String(typ)), dom("td",{className:"right"},fmtBytes(size)));
+    rowData.set(tr, {id, hash});
+    frag.appendChild(tr);
   });
+  tb.replaceChildren(frag);
   $("#btnSelectAll").disabled=false;
 }
 
+function previewFile(id, hash){
+  nextSlot = (nextSlot%4)+1;
+  // no cache-buster: the preview is fixed by fileHash, so re-picking a file reuses the loaded image
+  $(`#pv${nextSlot}`).replaceChildren(dom("img",{src:qs("/api/preview",{kod:currentExpense.kod, fileId:id, fileHash:hash}), alt:"", decoding:"async"}));
+  $("#btnOCR").disabled=false; $("#btnAI").disabled=false;
+  $("#btnOCR").onclick=async()=>{
+    const r=await jpost("/api/ocr",{kod:currentExpense.kod,fileId:id,fileHash:hash});
+    log(`[OCR] ${(r.text||"").slice(0,220)}${(r.text||"").length>220?"…":""}`);
+  };
+  $("#btnAI").onclick=async()=>{
+    const r=await jpost("/api/ai/extract",{kod:currentExpense.kod,fileId:id,fileHash:hash});
+    log(`[AI] ${JSON.stringify(r.fields)}`);
+  };
+}
+function toggleFile(id, hash, on){
+  if(on){ selected.set(id, { fileId:id, fileHash:hash }); }
+  else{ selected.delete(id); }
+  $("#tabSelected").textContent=`Selected (${selected.size})`;
+  const haveSel = selected.size>0;
+  $("#btnAdd").disabled = !haveSel;
+  $("#btnBulkOCR").disabled = !haveSel;
+  $("#btnBulkAI").disabled = !haveSel;
+}
+function wireTables(){
+  const files=$("#tblFiles tbody"), exps=$("#tblExpenses tbody");
+  const rowOf=(e)=>{ const tr=e.target.closest?.("tr"); return tr && rowData.get(tr); };
+  files.addEventListener("click",(e)=>{
+    if(e.target.tagName==="INPUT") return; // checkbox click
+    const f=rowOf(e); if(f) previewFile(f.id, f.hash);
+  });
+  files.addEventListener("change",(e)=>{
+    const f=rowOf(e); if(f && e.target.type==="checkbox") toggleFile(f.id, f.hash, e.target.checked);
+  });
+  exps.addEventListener("click",(e)=>{ const r=rowOf(e); if(r) openExpense(r.kod, r.hash); });
+}
+
 async function openExpense(kod, hash){
-  $("#jsonView").textContent="{}"; $("#lastExpenseRaw").textContent="{}";
+  showJSON($("#jsonView"), {}); showJSON($("#lastExpenseRaw"), {});
   $$("#pv1,#pv2,#pv3,#pv4").forEach(el=>el.innerHTML="Select a file");
   nextSlot=0; currentExpense={kod,hash,raw:null}; selected.clear(); $("#tabSelected").textContent=`Selected (0)`; $("#btnAdd").disabled=true; $("#btnBulkOCR").disabled=true; $("#btnBulkAI").disabled=true;
   try{
-    const js=await jget(`/api/expense?kod=${encodeURIComponent(kod)}&hash=${encodeURIComponent(hash)}`);
+    const js=await jget(qs("/api/expense",{kod, hash}));
     currentExpense.raw=js.raw||js;
-    $("#jsonView").textContent = JSON.stringify(js.raw||js,null,2);
-    $("#lastExpenseRaw").textContent = JSON.stringify(js.raw||js,null,2);
+    showJSON($("#jsonView"), currentExpense.raw);
+    showJSON($("#lastExpenseRaw"), currentExpense.raw);
     renderFiles(js.files||[]);
   }catch(err){
     $("#tblFiles tbody").innerHTML=`<tr><td colspan='6'>Error loading files</td></tr>`;
@@ -1125,25 +1642,48 @@ async function openExpense(kod, hash){
 
 function log(m){ const el=$("#activity"); if(!el) return; const line=`[${new Date().toLocaleTimeString()}] ${m}`; el.textContent+=(el.textContent?"\n":"")+line; el.scrollTop=el.scrollHeight; }
 
+/* adaptive pool for the bulk actions: starts at `start` parallel requests, gives one slot
+   back on every failed attempt (strain) and takes one more after 10 straight successes */
+function runPool(items, task, {start=6, min=2, max=12}={}){
+  let limit=start, active=0, next=0, settled=0, streak=0;
+  const strain=()=>{ streak=0; limit=Math.max(min, limit-1); };
+  return new Promise(resolve=>{
+    const results=new Array(items.length);
+    if(items.length===0){ resolve(results); return; }
+    const pump=()=>{
+      while(active<limit && next<items.length){
+        const i=next++; active++;
+        Promise.resolve().then(()=>task(items[i], strain)).then(
+          (value)=>{ results[i]={status:"fulfilled", value}; if(++streak>=10){ streak=0; limit=Math.min(max, limit+1); } },
+          (reason)=>{ results[i]={status:"rejected", reason}; strain(); },
+        ).finally(()=>{ active--; settled++; if(settled===items.length) resolve(results); else pump(); });
+      }
+    };
+    pump();
+  });
+}
+const backoff=(tries)=>sleep(Math.min(5000, 2**tries*250 + Math.random()*250));  // exponential, jittered
+
 async function addSelectedToDataset(){
   if(selected.size===0) return;
   const items=[...selected.values()];
   $("#btnAdd").disabled=true;
-  const concurrency=3;
-  let idx=0, ok=0, fail=0;
-  async function worker(){
-    while(idx<items.length){
-      const me=items[idx++]; const body={kod:currentExpense.kod,fileId:me.fileId,fileHash:me.fileHash,expenseHash:currentExpense.hash};
-      let tries=0, done=false;
-      while(!done && tries<3){
-        tries++;
-        try{ await jpost("/api/collect", body); log(`[collect] kod=${currentExpense.kod} fileId=${me.fileId} → saved`); ok++; done=true; }
-        catch(e){ log(`[collect] fileId=${me.fileId} error: ${(e&&e.message)||e}`); if(tries>=3){ fail++; done=true; } else { await sleep(600*tries); } }
+  let ok=0, fail=0;
+  await runPool(items, async(me, strain)=>{
+    const body={kod:currentExpense.kod,fileId:me.fileId,fileHash:me.fileHash,expenseHash:currentExpense.hash};
+    try{
+      for(let tries=1;;tries++){
+        try{ await jpost("/api/collect", body); log(`[collect] kod=${currentExpense.kod} fileId=${me.fileId} → saved`); ok++; return; }
+        catch(e){
+          log(`[collect] fileId=${me.fileId} error: ${(e&&e.message)||e}`);
+          if(tries>=3){ fail++; throw e; }
+          strain(); await backoff(tries);
+        }
       }
+    }finally{
       $("#bulkProg").style.width = `${Math.round(((ok+fail)/items.length)*100)}%`;
     }
-  }
-  await Promise.all(new Array(concurrency).fill(0).map(()=>worker()));
+  });
   log(`[collect] done ok=${ok} fail=${fail}`);
   $("#btnAdd").disabled=false; $("#bulkProg").style.width="0%";
 }
@@ -1151,22 +1691,18 @@ async function addSelectedToDataset(){
 async function bulkRun(kind){
   if(selected.size===0) return;
   const items=[...selected.values()];
-  const concurrency=4;
-  let idx=0, done=0;
-  async function worker(){
-    while(idx<items.length){
-      const me=items[idx++]; const body={kod:currentExpense.kod,fileId:me.fileId,fileHash:me.fileHash};
-      try{ await jpost(kind==="../api/ocr" ? "/api/ocr" : "/api/ai/extract", body); log(`[${kind==="../api/ocr"?"ocr":"ai"}] fileId=${me.fileId} ok`); }
-      catch(e){ log(`[${kind}] fileId=${me.fileId} error: ${(e&&e.message)||e}`); }
-      done++; $("#bulkProg").style.width = `${Math.round((done/items.length)*100)}%`;
-    }
-  }
-  await Promise.all(new Array(concurrency).fill(0).map(()=>worker()));
+  let done=0;
+  await runPool(items, async(me)=>{
+    const body={kod:currentExpense.kod,fileId:me.fileId,fileHash:me.fileHash};
+    try{ await jpost(kind==="../api/ocr" ? "/api/ocr" : "/api/ai/extract", body); log(`[${kind==="../api/ocr"?"ocr":"ai"}] fileId=${me.fileId} ok`); }
+    catch(e){ log(`[${kind}] fileId=${me.fileId} error: ${(e&&e.message)||e}`); throw e; }
+    finally{ done++; $("#bulkProg").style.width = `${Math.round((done/items.length)*100)}%`; }
+  });
 }
 
 function wireTabs(){
   $("#tabFiles").onclick=()=>{ $("#paneFiles").style.display="block"; $("#paneJSON").style.display="none"; };
-  $("#tabJSON").onclick=()=>{ $("#paneJSON").style.display="block"; $("#paneFiles").style.display="none"; };
+  $("#tabJSON").onclick=()=>{ $("#paneJSON").style.display="block"; $("#paneFiles").style.display="none"; flushJSON($("#paneJSON")); };
   $("#tabSelected").onclick=()=>{
     if(selected.size===0){ alert("No files selected."); return; }
     alert([...selected.keys()].length+" file(s) selected.");
@@ -1175,8 +1711,8 @@ function wireTabs(){
 
 /* --------------------------- config ---------------------------- */
 async function loadConfig(){
-  const js=await (await fetch("/api/config/effective")).json();
-  $("#cfgEffective").textContent=JSON.stringify(js,null,2);
+  const js=await (await fetch("/api/config/effective",{signal:navCtrl.signal})).json();
+  showJSON($("#cfgEffective"), js);
   renderKV($("#cfgEffectiveKV"), js);
   const o=js.user_overrides||{};
   $("#ovOllama").value=o.OLLAMA_BASE_URL||""; $("#ovInternal").value=o.INTERNAL_API_BASE||""; $("#ovS3e").value=o.S3_ENDPOINT||""; $("#ovS3b").value=o.S3_BUCKET||""; $("#ovS3r").value=o.S3_REGION||"";
@@ -1191,64 +1727,98 @@ async function saveConfig(){
   }};
   const r=await fetch("/api/config/user",{method:"POST",headers:{ "content-type":"application/json" },body:JSON.stringify(body)});
   if(!r.ok){ alert("Save failed"); return; }
+  jcacheDrop("/api/llm/models", "/api/status");  // the overrides can point at another Ollama
   await loadConfig(); alert("Saved. Ollama URL override applies immediately.");
 }
-async function clearConfig(){ await fetch("/api/config/clear",{method:"POST"}); await loadConfig(); }
+async function clearConfig(){ await fetch("/api/config/clear",{method:"POST"}); jcacheDrop("/api/llm/models", "/api/status"); await loadConfig(); }
 
 /* --------------------------- live api mgmt --------------------- */
 let liveCache=[];
 async function reloadLive(){
-  const js=await (await fetch("/api/live/events")).json();
+  const js=await (await fetch("/api/live/events",{signal:navCtrl.signal})).json();
   liveCache = js.events||[];
   $("#liveCount").textContent = liveCache.length+" events";
-  $("#liveJSON").textContent = JSON.stringify(js,null,2);
+  showJSON($("#liveJSON"), js);
   renderLiveTable();
 }
+// lower-cased search fields per event, built on first use; reloadLive swaps liveCache
+// for fresh objects, so stale entries just get collected
+const liveSearchKeys=new WeakMap();
+function liveKeys(ev){
+  let k=liveSearchKeys.get(ev);
+  if(!k){
+    const kind=(ev.kind||"").toLowerCase(), status=String(ev.status||"");
+    // free-text terms search these fields, not a serialization of the whole row
+    k={kind, status, hay:`${kind} ${status} ${ev.ms??""} ${ev.meta?JSON.stringify(ev.meta).toLowerCase():""}`};
+    liveSearchKeys.set(ev,k);
+  }
+  return k;
+}
 function renderLiveTable(){
   const q=$("#liveFilter").value.trim();
-  const tb=$("#liveTable tbody"); tb.innerHTML="";
-  const parts=q? q.split(/\s+/).filter(Boolean):[];
-  function match(ev){
-    if(parts.length===0) return true;
-    const hay = JSON.stringify(ev).toLowerCase();
-    return parts.every(p=>{
-      if(p.startsWith("kind:")) return (ev.kind||"").toLowerCase().includes(p.slice(5).toLowerCase());
-      if(p.startsWith("status:")) return String(ev.status||"").includes(p.slice(7));
-      return hay.includes(p.toLowerCase());
-    });
-  }
-  liveCache.filter(match).forEach(ev=>{
-    const tr=document.createElement("tr");
-    const st=Number(ev.status||0);
-    const stChip = st>=200 && st<300 ? "ok" : (st>=400?"err":"warn");
-    tr.innerHTML = `<td class="mono">${humanTime(ev.ts||0)}</td>
-      <td><span class="chip">${ev.kind||""}</span></td>
-      <td><span class="chip ${stChip}">${st}</span></td>
-      <td class="right mono">${Number(ev.ms||0).toFixed(1)}</td>
-      <td><details class="disc"><summary>meta</summary><pre class="json">${JSON.stringify(ev.meta||{},null,2)}</pre></details></td>`;
-    tb.appendChild(tr);
+  // parse the query once per render, not once per event
+  const terms=(q? q.split(/\s+/).filter(Boolean):[]).map(p=>{
+    if(p.startsWith("kind:")) return {f:"kind", v:p.slice(5).toLowerCase()};
+    if(p.startsWith("status:")) return {f:"status", v:p.slice(7)};
+    return {f:"hay", v:p.toLowerCase()};
   });
+  const rows = terms.length===0 ? liveCache : liveCache.filter(ev=>{
+    const k=liveKeys(ev);
+    for(const t of terms){ if(!k[t.f].includes(t.v)) return false; }
+    return true;
+  });
+  virtualRows($("#liveTable tbody"), rows, liveRow);
+}
+function liveRow(ev){
+  return dom("tr",null,
+    dom("td",{className:"mono"},humanTime(ev.ts||0)),
+    dom("td",null,dom("span",{className:"chip"},ev.kind||"")),
+    dom("td",null,statusChip(Number(ev.status||0))),
+    dom("td",{className:"right mono"},Number(ev.ms||0).toFixed(1)),
+    dom("td",null,jsonDetails("meta", ev.meta||{})));
 }
 function liveToCSV(){
   const cols=["ts","kind","status","ms","meta"];
-  const rows = (liveCache||[]).map(e=>[e.ts, e.kind, e.status, e.ms, JSON.stringify(e.meta||{})]);
-  const csv = [cols.join(","), ...rows.map(r=>r.map(x=>`"${String(x).replace(/"/g,'""')}"`).join(","))].join("\n");
-  const url = URL.createObjectURL(new Blob([csv],{type:"text/csv"}));
+  // quote only when needed; one string per row, the Blob joins them without a big intermediate string
+  const cell=(x)=>{ const v=String(x??""); return /[",\r\n]/.test(v) ? `"${v.replace(/"/g,'""')}"` : v; };
+  const chunks=[cols.join(",")+"\n"];
+  for(const e of (liveCache||[])){
+    chunks.push(`${cell(e.ts)},${cell(e.kind)},${cell(e.status)},${cell(e.ms)},${cell(JSON.stringify(e.meta||{}))}\n`);
+  }
+  const url = URL.createObjectURL(new Blob(chunks,{type:"text/csv"}));
   const a=document.createElement("a"); a.href=url; a.download="live_events.csv"; a.click(); URL.revokeObjectURL(url);
 }
 
 /* --------------------------- runtime wiring -------------------- */
+// canvas size comes from a ResizeObserver instead of reading clientWidth (a forced layout)
+// on every tick; draws are coalesced into the next frame and skipped when nothing changed
 function drawSpark(canvas, arr, maxPoints=60){
   if(!canvas) return;
+  if(!canvas._ro && window.ResizeObserver){
+    canvas._ro=new ResizeObserver(()=>{ canvas._w=canvas.clientWidth; canvas._h=canvas.clientHeight; queueSpark(canvas); });
+    canvas._ro.observe(canvas);
+  }
+  canvas._data=arr.slice(-maxPoints);
+  queueSpark(canvas);
+}
+function queueSpark(canvas){
+  if(canvas._raf) return;
+  canvas._raf=requestAnimationFrame(()=>{ canvas._raf=0; paintSpark(canvas); });
+}
+function paintSpark(canvas){
+  const data=canvas._data||[];
+  const w=canvas._w ?? canvas.clientWidth, h=canvas._h ?? canvas.clientHeight;
+  const sig=`${w}x${h}:${data.join(",")}`;
+  if(canvas._sig===sig) return;
+  canvas._sig=sig;
   const ctx=canvas.getContext("2d");
   if(!ctx) return;
-  const w=canvas.width = canvas.clientWidth;
-  const h=canvas.height = canvas.clientHeight;
+  if(canvas.width!==w) canvas.width=w;
+  if(canvas.height!==h) canvas.height=h;
   ctx.clearRect(0,0,w,h);
-  if(arr.length<2) return;
-  const data = arr.slice(-maxPoints);
-  const max = Math.max(100, ...data);
-  const min = Math.min(0, ...data);
+  if(data.length<2) return;
+  let max=100, min=0;
+  for(const v of data){ if(v>max) max=v; if(v<min) min=v; }
   ctx.beginPath();
   data.forEach((v,i)=>{
     const x = (i/(data.length-1))*w;
@@ -1259,13 +1829,23 @@ function drawSpark(canvas, arr, maxPoints=60){
 }
 
 function wireStats(){
+  // polls while the tab is visible (3s on the dashboard, 5s elsewhere), one tick at a time;
+  // a hidden tab stops the loop and showing it again restarts it with an immediate tick
+  let timer=0, inflight=false;
+  function schedule(){
+    clearTimeout(timer);
+    timer=setTimeout(tick, (location.hash||"#dash")==="#dash" ? 3000 : 5000);
+  }
   async function tick(){
+    if(document.hidden) return;
+    if(inflight){ schedule(); return; }
+    inflight=true;
     try{
       const [st, mx, md, liveSum] = await Promise.all([
-        jget("/api/status"),
-        jget("/api/metrics"),
-        jget("/api/llm/models"),
-        jget("/api/live/summary"),
+        jgetCached("/api/status"),
+        jgetCached("/api/metrics"),
+        jgetCached("/api/llm/models"),
+        jgetCached("/api/live/summary"),
       ]);
       $("#stat-api").innerHTML=st.internal_api?.msg||"";
       $("#stat-s3").innerHTML=(st.s3?.msg||"");
@@ -1275,13 +1855,19 @@ function wireStats(){
         ? `<span class="chip ok">${md.models.length} models</span>`
         : `<span class="chip warn">no models</span>`;
       $("#stat-events").innerHTML = `${liveSum.total||0} total • p95 ${liveSum.latency?.overall?.p95??"—"} ms`;
-      if($("#statusJSON")) $("#statusJSON").textContent=JSON.stringify(st,null,2), renderKV($("#statusKV"), st);
-      if($("#metricsJSON")) $("#metricsJSON").textContent=JSON.stringify(mx,null,2), renderKV($("#metricsKV"), mx);
+      if($("#statusJSON")) showJSON($("#statusJSON"), st), renderKV($("#statusKV"), st);
+      if($("#metricsJSON")) showJSON($("#metricsJSON"), mx), renderKV($("#metricsKV"), mx);
       // sparkline
-      if(mx?.sys?.mem!=null){ memHist.push(Number(mx.sys.mem)||0); drawSpark($("#memSpark"), memHist); }
+      if(mx?.sys?.mem!=null){
+        memHist.push(Number(mx.sys.mem)||0);
+        if(memHist.length>60) memHist.shift();  // the sparkline only shows the last 60
+        drawSpark($("#memSpark"), memHist);
+      }
     }catch(_){}
-    setTimeout(tick,3000);
+    finally{ inflight=false; }
+    schedule();
   }
+  document.addEventListener("visibilitychange",()=>{ if(!document.hidden) tick(); });
   tick();
 }
 
@@ -1291,109 +1877,117 @@ function router(){
   $(`#page-${hash}`)?.style.setProperty("display","block");
   $$("#nav-dash,#nav-tune,#nav-dataset,#nav-apis,#nav-chat,#nav-config,#nav-live").forEach(a=>a.classList.remove("active"));
   $(`#nav-${hash}`)?.classList.add("active");
+  navCtrl.abort(); navCtrl=new AbortController();
+  const quiet=(p)=>p.catch(e=>{ if(!isAbort(e)) console.error(e); });
   if(hash==="dash") dashReload();
   if(hash==="dataset") reloadDataset();
   if(hash==="apis") reloadModels();
   if(hash==="chat"){ renderSessions(); reloadModels(); }
-  if(hash==="config"){ loadConfig(); }
-  if(hash==="live"){ reloadLive(); }
+  if(hash==="config"){ quiet(loadConfig()); }
+  if(hash==="live"){ quiet(reloadLive()); }
 }
 
 let datasetCache=[];
 async function reloadDataset(){
   try{
-    const js=await jget("/api/dataset");
+    const js=await jget("/api/dataset", navCtrl.signal);
     datasetCache = js.items||[];
+    const live=new Set(datasetCache.map(it=>it.id));
+    for(const id of _dsNodes.keys()) if(!live.has(id)) _dsNodes.delete(id);
+    for(const it of datasetCache) searchKeys.set(it, [it.kod, it.fileId, it.fileHash].join("\0").toLowerCase());
     renderDataset(datasetCache);
     $("#dsCount").textContent=`${datasetCache.length} items`;
   }catch(err){
+    if(isAbort(err)) return;
     $("#datasetGrid").innerHTML="<div class='muted'>Failed to list dataset</div>";
   }
 }
-function renderDataset(items){
-  const grid=$("#datasetGrid"); grid.innerHTML="";
-  items.forEach(it=>{
-    const div=document.createElement("div"); div.className="card"; div.innerHTML=`
-      <div class="pad">
-        <div class="thumb"><img src="/api/dataset/image?id=${encodeURIComponent(it.id)}" alt=""></div>
-        <div class="mono" style="margin-top:8px">kod=${it.kod}</div>
-        <div class="mono">fileId=${it.fileId}</div>
-        <div class="small muted">${it.fileHash}</div>
-      </div>`;
-    div.style.cursor="pointer";
-    div.onclick=async()=>{
-      const meta=await jget(`/api/dataset/meta?id=${encodeURIComponent(it.id)}`);
-      $("#dsMeta").textContent=JSON.stringify(meta,null,2);
-      // structured meta
-      const kv=$("#dsMetaKV"); kv.innerHTML="";
-      const core = {
-        schema: meta.schema, source: meta.source, kod: meta.kod, fileId: meta.fileId, fileHash: meta.fileHash,
-        content_type: meta.content_type, size_bytes: meta.size_bytes, ts: meta.ts,
-        s3_key_image: meta.s3_key_image, s3_key_meta: meta.s3_key_meta
-      };
-      renderKV(kv, core);
-      // siblings
-      const sib=await jget(`/api/dataset/by-expense?kod=${encodeURIComponent(it.kod)}`);
-      const sg=$("#dsSiblings"); sg.innerHTML="";
-      (sib.items||[]).forEach(s=>{
-        const box=document.createElement("div"); box.className="card"; box.innerHTML=`
-          <div class="pad">
-            <div class="thumb"><img src="/api/dataset/image?id=${encodeURIComponent(s.id)}" alt=""></div>
-            <div class="mono" style="margin-top:8px">fileId=${s.fileId}</div>
-          </div>`;
-        sg.appendChild(box);
-      });
+// id -> card; cards survive reloads and search filtering so their thumbnails are not refetched
+const _dsNodes=new Map();
+function dsCard(it){
+  const div=document.createElement("div"); div.className="card"; div.innerHTML=`
+    <div class="pad">
+      <div class="thumb"><img src="${qs("/api/dataset/image",{id:it.id})}" alt="" loading="lazy" decoding="async"></div>
+      <div class="mono" style="margin-top:8px">kod=${it.kod}</div>
+      <div class="mono">fileId=${it.fileId}</div>
+      <div class="small muted">${it.fileHash}</div>
+    </div>`;
+  div.style.cursor="pointer";
+  div.onclick=async()=>{
+    const meta=await jget(qs("/api/dataset/meta",{id:it.id}));
+    showJSON($("#dsMeta"), meta);
+    // structured meta
+    const kv=$("#dsMetaKV");
+    const core = {
+      schema: meta.schema, source: meta.source, kod: meta.kod, fileId: meta.fileId, fileHash: meta.fileHash,
+      content_type: meta.content_type, size_bytes: meta.size_bytes, ts: meta.ts,
+      s3_key_image: meta.s3_key_image, s3_key_meta: meta.s3_key_meta
     };
-    grid.appendChild(div);
-  });
+    renderKV(kv, core);
+    // siblings
+    const sib=await jget(qs("/api/dataset/by-expense",{kod:it.kod}));
+    const sg=$("#dsSiblings"), sfrag=document.createDocumentFragment();
+    (sib.items||[]).forEach(s=>{
+      const box=document.createElement("div"); box.className="card"; box.innerHTML=`
+        <div class="pad">
+          <div class="thumb"><img src="${qs("/api/dataset/image",{id:s.id})}" alt="" loading="lazy" decoding="async"></div>
+          <div class="mono" style="margin-top:8px">fileId=${s.fileId}</div>
+        </div>`;
+      sfrag.appendChild(box);
+    });
+    sg.replaceChildren(sfrag);
+  };
+  return div;
+}
+function renderDataset(items){
+  const grid=$("#datasetGrid");
+  let node=grid.firstElementChild;
+  for(const it of items){
+    let card=_dsNodes.get(it.id);
+    if(!card){ card=dsCard(it); _dsNodes.set(it.id, card); }
+    if(card===node) node=node.nextElementSibling;
+    else grid.insertBefore(card, node);
+  }
+  while(node){ const next=node.nextElementSibling; node.remove(); node=next; }
 }
 
 /* filters & search */
-$("#expSearch")?.addEventListener("input", e=>{
+$("#expSearch")?.addEventListener("input", debounce(e=>{
   const q=e.target.value.toLowerCase();
-  const filtered = lastExpensesCache.filter(r=>{
-    const kod=String(r.Kod??r.kod??r.id??"");
-    const acik = String(r.Aciklama??r.aciklama??"").toLowerCase();
-    const bol = String(r.Bolum??r.bolum??"").toLowerCase();
-    return kod.toLowerCase().includes(q)||acik.includes(q)||bol.includes(q);
-  });
-  const tb=$("#tblExpenses tbody"); tb.innerHTML="";
-  filtered.forEach(r=>{
-    const tr=document.createElement("tr");
-    const kod = r.Kod ?? r.kod ?? r.id ?? r.code ?? "";
-    const acik = r.Aciklama ?? r.aciklama ?? r.desc ?? "";
-    const bol = r.Bolum ?? r.bolum ?? r.dept ?? "";
-    const h = r.Hash ?? r.hash ?? r.h ?? "";
-    tr.innerHTML=`<td class="mono">${kod}</td><td>${acik}</td><td>${bol}</td><td class="mono">${h}</td>`;
-    tr.onclick=()=>openExpense(kod,h);
-    tb.appendChild(tr);
-  });
+  if(lastExpensesCache.length<=VROWS_MIN){
+    // not windowed, so every row is already in the tbody: show/hide instead of rebuilding
+    let n=0;
+    for(const r of lastExpensesCache){ const hit=searchKeys.get(r).includes(q); expenseRow(r).hidden=!hit; if(hit) n++; }
+    $("#expCount").textContent=String(n);
+    return;
+  }
+  const filtered = lastExpensesCache.filter(r=>searchKeys.get(r).includes(q));
+  fillExpenseRows($("#tblExpenses tbody"), filtered);
   $("#expCount").textContent=String(filtered.length);
-});
-$("#dsSearch")?.addEventListener("input", e=>{
+}));
+$("#dsSearch")?.addEventListener("input", debounce(e=>{
   const q=e.target.value.toLowerCase();
-  const filtered = datasetCache.filter(it=> String(it.kod).includes(q) || String(it.fileId).includes(q) || String(it.fileHash).toLowerCase().includes(q));
-  renderDataset(filtered);
-});
-$("#liveFilter")?.addEventListener("input", ()=>renderLiveTable());
+  renderDataset(datasetCache.filter(it=>searchKeys.get(it).includes(q)));
+}));
+$("#liveFilter")?.addEventListener("input", debounce(renderLiveTable));
 
 document.addEventListener("DOMContentLoaded",()=>{
-  setDates(); wireStats(); wireTabs(); router();
+  setDates(); wireStats(); wireTabs(); wireTables(); router();
   window.addEventListener("hashchange",router);
 
   // dashboard
-  $("#dashReload")?.addEventListener("click", dashReload);
+  $("#dashReload")?.addEventListener("click", throttle(dashReload));
 
   // tune actions
   $("#btnLoad").onclick=loadExpenses;
-  $("#btnSelectAll").onclick=()=>{ $$("#tblFiles tbody input[type=checkbox]").forEach(cb=>{ if(!cb.checked){ cb.checked=true; cb.dispatchEvent(new Event("change")); } }); };
+  $("#btnSelectAll").onclick=()=>{ $$("#tblFiles tbody input[type=checkbox]").forEach(cb=>{ if(!cb.checked){ cb.checked=true; cb.dispatchEvent(new Event("change",{bubbles:true})); } }); };
   $("#btnAdd").onclick=addSelectedToDataset;
   $("#btnBulkOCR").onclick=()=>bulkRun("../api/ocr");
   $("#btnBulkAI").onclick=()=>bulkRun("../api/ai");
 
   // chat wiring
-  $("#btnSend").onclick=sendChat;
-  $("#btnReloadModels").onclick=reloadModels;
+  if(typeof sendChat==="function") $("#btnSend").onclick=sendChat;  // not defined in this build; don't abort the rest of the wiring
+  $("#btnReloadModels").onclick=()=>{ jcacheDrop("/api/llm/models"); reloadModels(); };
   $("#btnExport").onclick=()=>{
     const data = JSON.stringify(sessions[curSession],null,2);
     const url = URL.createObjectURL(new Blob([data],{type:"application/json"}));
@@ -1408,13 +2002,13 @@ document.addEventListener("DOMContentLoaded",()=>{
   $("#btnReloadDataset")?.addEventListener("click",reloadDataset);
 
   // config
-  $("#btnCfgSave")?.addEventListener("click", saveConfig);
+  $("#btnCfgSave")?.addEventListener("click", throttle(saveConfig));
   $("#btnCfgClear")?.addEventListener("click", clearConfig);
 
   // live api mgmt
-  $("#btnLiveRefresh")?.addEventListener("click", reloadLive);
-  $("#btnLiveClear")?.addEventListener("click", async()=>{ await fetch("/api/live/clear",{method:"POST"}); reloadLive(); });
-  $("#btnLiveCSV")?.addEventListener("click", liveToCSV);
+  $("#btnLiveRefresh")?.addEventListener("click", throttle(()=>{ jcacheDrop("/api/live/summary"); reloadLive(); }));
+  $("#btnLiveClear")?.addEventListener("click", async()=>{ await fetch("/api/live/clear",{method:"POST"}); jcacheDrop("/api/live/summary"); reloadLive(); });
+  $("#btnLiveCSV")?.addEventListener("click", throttle(liveToCSV));
 
   // file upload previews
   $("#filePick").addEventListener("change",()=>uploadFiles());
@@ -1423,6 +2017,47 @@ document.addEventListener("DOMContentLoaded",()=>{
 </body></html>
     """
 
+# JSON pretty-print worker for the raw viewers; content-versioned like the /ai_chat assets
+_PRETTY_JS_BYTES = (pathlib.Path(__file__).with_name("static") / "ui_json_pretty.js").read_bytes()
+_PRETTY_JS_HASH = hashlib.blake2b(_PRETTY_JS_BYTES, digest_size=8).hexdigest()
+_PRETTY_JS_HEADERS = {"ETag": '"' + _PRETTY_JS_HASH + '"', "Cache-Control": "public, max-age=31536000, immutable"}
+
+# encoded once; /ui only compares ETags and writes these bytes. The str is dropped
+# afterwards: it has non-ASCII characters, so CPython holds it at 2 bytes per char.
+_UI_HTML_BYTES = _UI_HTML.replace(
+    "__PRETTY_WORKER_URL__", "/static/ui_json_pretty.js?v=" + _PRETTY_JS_HASH
+).encode("utf-8")
+del _UI_HTML
+_UI_HEADERS = {"Cache-Control": "public, max-age=60", "Vary": "Accept-Encoding"}
+# strong validators differ per representation: content-encoding -> ETag
+_UI_HASH = hashlib.blake2b(_UI_HTML_BYTES, digest_size=8).hexdigest()
+_UI_ETAGS = {enc: '"' + _UI_HASH + ("-" + enc if enc else "") + '"' for enc in ("", "gzip", "br")}
+# compressed once at import, so serving a compressed /ui costs nothing per request
+_UI_HTML_ENCODED = {"gzip": gzip.compress(_UI_HTML_BYTES, compresslevel=9)}
+if brotli is not None:
+    _UI_HTML_ENCODED["br"] = brotli.compress(_UI_HTML_BYTES, quality=11)
+
+@router.get("/ui", response_class=HTMLResponse)
+def ui(request: Request) -> Response:
+    inm = request.headers.get("if-none-match")
+    if inm in _UI_ETAGS.values():
+        return Response(status_code=304, headers={"ETag": inm, **_UI_HEADERS})
+    accepted = _accepted_encodings(request.headers.get("accept-encoding"))
+    enc = next((e for e in ("br", "gzip") if e in accepted and e in _UI_HTML_ENCODED), "")
+    if enc:
+        return Response(
+            content=_UI_HTML_ENCODED[enc],
+            headers={"ETag": _UI_ETAGS[enc], **_UI_HEADERS, "Content-Encoding": enc},
+            media_type="text/html; charset=utf-8",
+        )
+    return Response(content=_UI_HTML_BYTES, headers={"ETag": _UI_ETAGS[""], **_UI_HEADERS}, media_type="text/html; charset=utf-8")
+
+@router.get("/static/ui_json_pretty.js", include_in_schema=False)
+def ui_json_pretty_worker(request: Request) -> Response:
+    if request.headers.get("if-none-match") == _PRETTY_JS_HEADERS["ETag"]:
+        return Response(status_code=304, headers=_PRETTY_JS_HEADERS)
+    return Response(content=_PRETTY_JS_BYTES, headers=_PRETTY_JS_HEADERS, media_type="text/javascript; charset=utf-8")
+
 # --------------------------------------------------------------------------- #
 # API used by the UI (status, metrics, dataset, expense, preview, ocr, ai)
 # + Config (effective/user overrides)
@@ -1569,8 +2204,8 @@ def preview(
     t0 = time.time()
     try:
         b64 = client.expense_file_base64(kod=kod, file_id=fileId, file_hash=fileHash)
-        raw = base64.b64decode(b64, validate=False)
-        im = Image.open(io.BytesIO(raw))
+        raw = _b64.b64decode(b64, validate=False)
+        im = _pil().open(io.BytesIO(raw))
         buf = io.BytesIO()
         im.save(buf, format="PNG")
         _record_api_event("internal:preview", 200, (time.time()-t0)*1000, {"kod": kod, "fileId": fileId})
@@ -1622,7 +2257,7 @@ def collect(
         return JSONResponse({"error": f"download failed: {last_err}"}, status_code=400)
 
     try:
-        raw_bytes = base64.b64decode(b64, validate=False)
+        raw_bytes = _b64.b64decode(b64, validate=False)
     except Exception as e:
         _record_api_event("collect", 400, (time.time()-t0)*1000, {"err": "decode"})
         return JSONResponse({"error": f"base64 decode failed: {e}"}, status_code=400)
@@ -1635,7 +2270,7 @@ def collect(
         pass
 
     try:
-        im = Image.open(io.BytesIO(raw_bytes))
+        im = _pil().open(io.BytesIO(raw_bytes))
         buf = io.BytesIO()
         im.save(buf, format="PNG")
         png_bytes = buf.getvalue()
@@ -1672,6 +2307,7 @@ def collect(
     }
     try:
         paths["meta"].write_text(_safe_json(meta), encoding="utf-8")
+        _bump_dataset_gen()
     except Exception as e:
         _record_api_event("collect", 500, (time.time()-t0)*1000, {"err": "store_meta"})
         return JSONResponse({"error": f"store meta failed: {e}"}, status_code=500)
@@ -1691,13 +2327,13 @@ def collect(
 def dataset_list(s3: S3Store = Depends(get_s3_store)) -> Dict[str, Any]:
     root = _dataset_root(s3) / "dataset"
     t0 = time.time()
-    items = _scan_items_under(root)
+    items = _dataset_items(root)
     _record_api_event("dataset:list", 200, (time.time()-t0)*1000, {"count": len(items)})
     return {"items": items}
 
 @router.get("/api/dataset/by-expense")
 def dataset_by_expense(kod: int, s3: S3Store = Depends(get_s3_store)) -> Dict[str, Any]:
-    return {"items": _scan_items_under(_dataset_root(s3) / "dataset" / f"kod_{kod}")}
+    return {"items": _dataset_items(_dataset_root(s3) / "dataset" / f"kod_{kod}", rel=f"kod_{kod}")}
 
 @router.get("/api/dataset/image")
 def dataset_image(id: str, s3: S3Store = Depends(get_s3_store)):
@@ -1706,7 +2342,8 @@ def dataset_image(id: str, s3: S3Store = Depends(get_s3_store)):
     img_path = (root / rel / "image.png").resolve()
     if not img_path.is_file() or root not in img_path.parents:
         return Response(status_code=404)
-    return Response(content=img_path.read_bytes(), media_type="image/png")
+    # streamed from disk (sendfile where available) rather than read into memory first
+    return FileResponse(img_path, media_type="image/png")
 
 @router.get("/api/dataset/meta")
 def dataset_meta(id: str, s3: S3Store = Depends(get_s3_store)):
@@ -1715,17 +2352,19 @@ def dataset_meta(id: str, s3: S3Store = Depends(get_s3_store)):
     meta_path = (root / rel / "meta.json").resolve()
     if not meta_path.is_file() or root not in meta_path.parents:
         return JSONResponse({"error": "not found"}, status_code=404)
+    raw = meta_path.read_bytes()
     try:
-        return json.loads(meta_path.read_text(encoding="utf-8"))
+        _loads(raw)  # validate only; the stored bytes go out as-is, no re-encode
     except Exception:
         return JSONResponse({"error": "meta parse error"}, status_code=400)
+    return Response(content=raw, media_type="application/json")
 
 @router.get("/api/dataset/summary")
-def dataset_summary(s3: S3Store = Depends(get_s3_store)):
+def dataset_summary(request: Request, s3: S3Store = Depends(get_s3_store)):
     t0 = time.time()
     out = _dataset_summary(s3)
     _record_api_event("dataset:summary", 200, (time.time()-t0)*1000, {"count": out.get("count", 0)})
-    return out
+    return _json_response(request, out)
 
 # ------------------------------ OCR / AI stub ------------------------------- #
 
@@ -1734,11 +2373,11 @@ def ocr_endpoint(body: FileRef, client: InternalAPIClient = Depends(get_internal
     t0 = time.time()
     try:
         b64 = client.expense_file_base64(kod=body.kod, file_id=body.fileId, file_hash=body.fileHash)
-        raw = base64.b64decode(b64, validate=False)
-        im = Image.open(io.BytesIO(raw)).convert("RGB")
+        raw = _b64.b64decode(b64, validate=False)
+        im = _pil().open(io.BytesIO(raw)).convert("RGB")
         out = io.BytesIO()
         im.save(out, format="PNG")
-        png_b64 = base64.b64encode(out.getvalue()).decode("ascii")
+        png_b64 = _b64.b64encode(out.getvalue()).decode("ascii")
     except Exception as e:
         _record_api_event("ocr", 400, (time.time()-t0)*1000, {"err": str(e)})
         return JSONResponse({"error": f"OCR input error: {e}"}, status_code=400)
@@ -1778,18 +2417,47 @@ class ChatIn(BaseModel):
     system: Optional[str] = None
     messages: List[ChatMsg]
 
+_NO_MODELS_NOTE = "No models from Ollama. Example commands:"
+_NO_MODELS_COMMANDS = ["ollama pull llama3:8b", "ollama pull qwen2.5:7b-instruct", "ollama list"]
+
+def _http_error(js: dict) -> Optional[Tuple[str, Optional[int]]]:
+    """(error, status) when `js` is exactly an _http_json error dict, else None."""
+    if "error" not in js or not js.keys() <= {"error", "status"}:
+        return None
+    return js["error"], js.get("status")
+
+# While Ollama is down, the dashboard polls /api/llm/models and gets the same
+# handful of error bodies every time. Serialize each one once.
+@lru_cache(maxsize=64)
+def _no_models_bytes(error: str, status: Optional[int]) -> bytes:
+    raw = {"error": error} if status is None else {"error": error, "status": status}
+    return _dumps_bytes({
+        "ok": True,
+        "note": _NO_MODELS_NOTE,
+        "commands": _NO_MODELS_COMMANDS,
+        "raw": {"ok": True, "models": [], "raw": raw},
+    })
+
+@lru_cache(maxsize=64)
+def _chat_error_bytes(error: str, status: Optional[int]) -> bytes:
+    raw = {"error": error} if status is None else {"error": error, "status": status}
+    return _dumps_bytes({"error": error, "raw": raw})
+
 @router.get("/api/llm/models")
 def llm_models() -> Dict[str, Any]:
     url = _get_ollama_base_url()
     js = _http_json("GET", f"{url}/api/tags")
+    err = _http_error(js)
+    if err is not None:
+        return Response(content=_no_models_bytes(*err), media_type="application/json")
     models = []
     for m in (js.get("models") or []):
         models.append({"name": m.get("name"), "details": m.get("details", {}), "size": m.get("size")})
     if not models:
         return {
             "ok": True,
-            "note": "No models from Ollama. Example commands:",
-            "commands": ["ollama pull llama3:8b", "ollama pull qwen2.5:7b-instruct", "ollama list"],
+            "note": _NO_MODELS_NOTE,
+            "commands": _NO_MODELS_COMMANDS,
             "raw": {"ok": True, "models": [], "raw": js},
         }
     return {"ok": True, "models": models, "raw": js}
@@ -1812,7 +2480,7 @@ def llm_file(session_id: str, token: str):
     root = _upload_dir(session_id).resolve()
     if not path.is_file() or root not in path.parents:
         return Response(status_code=404)
-    return Response(content=path.read_bytes(), media_type=_guess_mime(path))
+    return FileResponse(path, media_type=_guess_mime(path))
 
 # @router.post("/api/llm/chat")
 # def llm_chat(inp: ChatIn):
@@ -2020,7 +2688,7 @@ def llm_chat(inp: ChatIn):
             p = (_upload_dir(inp.session_id) / tok).resolve()
             if p.is_file():
                 try:
-                    imgs.append(base64.b64encode(p.read_bytes()).decode("ascii"))
+                    imgs.append(_b64.b64encode(p.read_bytes()).decode("ascii"))
                 except Exception:
                     pass
         if imgs:
@@ -2030,6 +2698,9 @@ def llm_chat(inp: ChatIn):
     body = {"model": inp.model, "messages": payload_messages, "stream": False}
     out = _http_json("POST", f"{url}/api/chat", body, timeout=120.0)
     if out.get("error"):
+        err = _http_error(out)
+        if err is not None:
+            return Response(content=_chat_error_bytes(*err), status_code=int(err[1] or 500), media_type="application/json")
         return JSONResponse({"error": out.get("error"), "raw": out}, status_code=int(out.get("status", 500)))
 
     reply = ((out.get("message") or {}).get("content")) or ""
@@ -2054,11 +2725,13 @@ def config_user_save(payload: UserOverrides):
 
 @router.post("/api/config/clear")
 def config_clear():
+    global _CFG_CACHE
     try:
         _config_path().unlink(missing_ok=True)  # py3.8+: set False if not supported
     except TypeError:
         if _config_path().exists():
             _config_path().unlink()
+    _CFG_CACHE = None
     return {"ok": True}
 
 # --------------------------------------------------------------------------- #
@@ -2066,17 +2739,17 @@ def config_clear():
 # --------------------------------------------------------------------------- #
 
 @router.get("/api/live/events")
-def live_events():
-    return {"events": list(API_EVENTS)}
+def live_events(request: Request):
+    return _json_response(request, {"events": _api_events()})
 
 @router.post("/api/live/clear")
 def live_clear():
-    API_EVENTS.clear()
+    _clear_api_events()
     return {"ok": True}
 
 @router.get("/api/live/summary")
-def live_summary():
+def live_summary(request: Request):
     t0 = time.time()
     out = _live_summary()
     _record_api_event("live:summary", 200, (time.time()-t0)*1000, {"total": out.get("total", 0)})
-    return out
+    return _json_response(request, out)
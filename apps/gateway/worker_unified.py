@@ -3,7 +3,7 @@ from __future__ import annotations
 import os, json, time
 import redis, httpx
 
-from apps.gateway.events_bus import _redis, set_state
+from apps.gateway.events_bus import _redis, _loads, set_state
 # Reuse your existing OCR/engine if present; otherwise minimal stubs
 try:
     from apps.gateway.ocr import run_ocr_text  # your implementation
@@ -35,7 +35,7 @@ def _pop_job(timeout=5):
     if not job:
         return None
     _, payload = job
-    return json.loads(payload)
+    return _loads(payload)
 
 def main_loop():
     while True:
@@ -9,6 +9,11 @@ from PIL import Image
 import pytesseract
 from pdf2image import convert_from_bytes
 
+try:
+    import pybase64 as _b64  # type: ignore
+except Exception:  # pragma: no cover
+    _b64 = base64  # type: ignore
+
 
 @dataclass
 class OCRResult:
@@ -22,7 +27,7 @@ class OCRResult:
 def _png_b64_from_pil(img: Image.Image) -> str:
     buf = io.BytesIO()
     img.save(buf, format="PNG")
-    return base64.b64encode(buf.getvalue()).decode("ascii")
+    return _b64.b64encode(buf.getvalue()).decode("ascii")
 
 
 def _to_rgb_img(data: bytes) -> Image.Image:
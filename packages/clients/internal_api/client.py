@@ -32,6 +32,7 @@ class InternalAPIClient:
         email: str,
         password: str,
         timeout: int = 30,
+        transport: Optional[httpx.BaseTransport] = None,
     ) -> None:
         self.base_url = base_url.rstrip("/")
         self.auth_url = self._resolve(auth_url)
@@ -42,8 +43,10 @@ class InternalAPIClient:
         self.password = password
         self.timeout = timeout
 
+        # `transport` lets callers share one keep-alive pool across clients
         self._client = httpx.Client(
             timeout=self.timeout,
+            transport=transport,
             headers={"Accept": "application/json", "User-Agent": "pruva-invoice-extractor/1.0"},
         )
 